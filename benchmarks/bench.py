@@ -0,0 +1,337 @@
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+  import resource
+except ImportError: # Windows
+  resource = None
+
+from generator import (COLLECTION_DIR, ROOT, TRANSFORMATION_DIR, Scale, add_scale_arguments, generate_tournaments,
+                       scale_from_args, write_tournaments)
+from standin import ServerOptions, StandinServer
+
+# Benchmarks of the whole pipeline, on synthetic tournaments (see generator.py) and a local stand-in of the
+# site (see standin.py), without network access nor the live site
+#
+# crawl: data_collection/main.py against the stand-in, cold cache and empty output
+# parse: the crawler's page parsers on rendered pages, per page type
+# transform: compute_all_inserts on the tournaments written by the crawler
+# load: full PostgreSQL load of data_transformation/main.py (only with --dsn: it recreates every table)
+#
+# Each scenario runs in its own process, so its peak memory is not mixed with the setup or the other scenarios.
+# Results are printed and appended to a json-lines history, compared with the previous run of the same scenario
+# at the same scale and options.
+
+SCENARIOS = ("crawl", "parse", "transform", "load")
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+@dataclass
+class BenchOptions:
+  workspace: str
+  server: ServerOptions = field(default_factory=ServerOptions)
+  concurrency: int = 20
+  max_rate: float = 1000 # far above the stand-in's capacity: the crawl is not throttled by the rate limiter
+  workers: int = 8
+  parse_workers: int = -1 # parse on the event loop, so that the whole crawl is in the measured process
+  parser: str = "html.parser"
+  sample: int = 20 # tournaments whose pages are parsed by the parse scenario
+  repeat: int = 1 # passes of the parse scenario over its pages
+  dsn: str | None = None
+
+# Peak resident memory of this process; Windows has no getrusage, the peak of python allocations is used instead
+def peak_memory_mb() -> float:
+  if resource is None:
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+# Workspace laid out like the repository: data_collection/ with the card files, data_transformation/ as the
+# working directory of the transformer
+def prepare_workspace(workspace: str):
+  collection = os.path.join(workspace, "data_collection")
+  os.makedirs(os.path.join(collection, "output"), exist_ok=True)
+  os.makedirs(os.path.join(workspace, "data_transformation"), exist_ok=True)
+  for name in ("all_cards.json", "extensions.json"):
+    shutil.copy(os.path.join(COLLECTION_DIR, name), collection)
+
+def import_main(directory: str):
+  sys.path.insert(0, directory)
+  import main
+  return main
+
+def scenario_crawl(scale: Scale, options: BenchOptions, base_url: str) -> dict:
+  workdir = os.path.join(options.workspace, "crawl")
+  shutil.rmtree(workdir, ignore_errors=True)
+  os.makedirs(workdir)
+  os.chdir(workdir)
+  collector = import_main(COLLECTION_DIR)
+  config = collector.CrawlConfig(
+    base_url=base_url,
+    proxy=None,
+    concurrency=options.concurrency,
+    max_rate=options.max_rate,
+    workers=options.workers,
+    parse_workers=options.parse_workers,
+    parser=options.parser,
+    metrics_path="crawl_metrics.json",
+  )
+  start, cpu = time.perf_counter(), time.process_time()
+  with contextlib.redirect_stdout(io.StringIO()):
+    failed = asyncio.run(collector.main(config))
+  elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+  with open("crawl_metrics.json", encoding="utf-8") as f:
+    metrics = json.load(f)
+  return {
+    "elapsed": elapsed,
+    "cpu": cpu,
+    "items": metrics["tournaments_written"],
+    "unit": "tournaments",
+    "details": {
+      "pages": metrics["pages"],
+      "pages_per_second": round(metrics["pages"] / elapsed, 1),
+      "megabytes": round(metrics["bytes_from_network"] / 1024 / 1024, 2),
+      "retries": metrics["retries"],
+      "failed": failed,
+    },
+  }
+
+def scenario_parse(scale: Scale, options: BenchOptions) -> dict:
+  from standin import render_decklist, render_pairings, render_standings, render_tournament_list
+  collector = import_main(COLLECTION_DIR)
+  tournaments = generate_tournaments(Scale(**{**asdict(scale), "tournaments": min(scale.tournaments, options.sample)}))
+  pages = {
+    "tournament_list": (collector.parse_tournament_list_page, [render_tournament_list(tournaments, 1, options.server.per_page)]),
+    "standings": (collector.parse_standings_page, [render_standings(t) for t in tournaments]),
+    "decklist": (collector.parse_decklist_page,
+                 [render_decklist(t, player) for t in tournaments for player in t.tournament["players"]]),
+    "pairings": (collector.parse_pairings_page,
+                 [render_pairings(t, n) for t in tournaments for n in range(1, len(t.rounds) + 1)]
+                 + [render_pairings(t, None) for t in tournaments if t.bracket]),
+  }
+  details = {}
+  total_elapsed = total_cpu = 0
+  total_pages = 0
+  for kind, (parse, htmls) in pages.items():
+    start, cpu = time.perf_counter(), time.process_time()
+    for _ in range(options.repeat):
+      for html in htmls:
+        parse(html, options.parser)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+    nb_pages = len(htmls) * options.repeat
+    megabytes = sum(len(html.encode("utf-8")) for html in htmls) * options.repeat / 1024 / 1024
+    details[kind] = {"pages": nb_pages, "pages_per_second": round(nb_pages / elapsed, 1),
+                     "mb_per_second": round(megabytes / elapsed, 2)}
+    total_elapsed += elapsed
+    total_cpu += cpu
+    total_pages += nb_pages
+  return {"elapsed": total_elapsed, "cpu": total_cpu, "items": total_pages, "unit": "pages", "details": details}
+
+def scenario_transform(scale: Scale, options: BenchOptions) -> dict:
+  os.chdir(os.path.join(options.workspace, "data_transformation"))
+  transformer = import_main(TRANSFORMATION_DIR)
+  with contextlib.redirect_stdout(io.StringIO()):
+    transformer.CardIndex.load()
+  start, cpu = time.perf_counter(), time.process_time()
+  tournaments = transformer.load_all_tournaments()
+  tournament_rows, decklist_rows, card_rows, summary_rows = transformer.compute_all_inserts(tournaments)
+  elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+  return {
+    "elapsed": elapsed,
+    "cpu": cpu,
+    "items": len(tournament_rows),
+    "unit": "tournaments",
+    "details": {"decklist_rows": len(decklist_rows), "rows_per_second": round(len(decklist_rows) / elapsed, 1)},
+  }
+
+def scenario_load(scale: Scale, options: BenchOptions) -> dict:
+  os.chdir(os.path.join(options.workspace, "data_transformation"))
+  transformer = import_main(TRANSFORMATION_DIR)
+  transformer.get_conn_str = lambda: options.dsn
+  with contextlib.redirect_stdout(io.StringIO()):
+    index = transformer.CardIndex.load()
+    start, cpu = time.perf_counter(), time.process_time()
+    state = transformer.load_database(index, False, 1, [])
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+  return {
+    "elapsed": elapsed,
+    "cpu": cpu,
+    "items": state.nb_tournaments,
+    "unit": "tournaments",
+    "details": {"deck_rows": state.nb_decks, "cards": len(state.new_cards)},
+  }
+
+SCENARIO_FUNCTIONS = {
+  "crawl": scenario_crawl,
+  "parse": scenario_parse,
+  "transform": scenario_transform,
+  "load": scenario_load,
+}
+
+# Entry point of the scenario process
+def run_scenario(name: str, scale: Scale, options: BenchOptions, args: tuple, connection):
+  if resource is None:
+    import tracemalloc
+    tracemalloc.start()
+  try:
+    result = SCENARIO_FUNCTIONS[name](scale, options, *args)
+    result["peak_memory_mb"] = round(peak_memory_mb(), 1)
+    connection.send(result)
+  except BaseException as e:
+    connection.send({"error": repr(e)})
+    raise
+
+def run_in_process(name: str, scale: Scale, options: BenchOptions, *args) -> dict:
+  context = multiprocessing.get_context("spawn")
+  receiver, sender = context.Pipe(duplex=False)
+  process = context.Process(target=run_scenario, args=(name, scale, options, args, sender))
+  process.start()
+  result = receiver.recv()
+  process.join()
+  return result
+
+def git_commit() -> str | None:
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                          check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+# Options that change the numbers: two runs are only compared if they are the same
+def run_key(record: dict) -> str:
+  return json.dumps([record["scenario"], record["scale"], record["options"]], sort_keys=True)
+
+def load_history(path: str) -> dict:
+  previous = {}
+  if os.path.isfile(path):
+    with open(path, encoding="utf-8") as f:
+      for line in f:
+        if line.strip():
+          record = json.loads(line)
+          previous[run_key(record)] = record
+  return previous
+
+def change(current: float, previous: float | None) -> str:
+  if not previous:
+    return ""
+  return f" ({(current - previous) / previous * 100:+.1f}%)"
+
+def print_result(record: dict, previous: dict | None):
+  if "error" in record:
+    print(f"{record['scenario']:<10} failed: {record['error']}")
+    return
+  print(f"{record['scenario']:<10}{record['items']:>8} {record['unit']:<12}"
+        f"{record['elapsed']:>8.2f}s{record['cpu']:>8.2f}s cpu"
+        f"{record['throughput']:>10.1f} {record['unit']}/s{change(record['throughput'], previous and previous['throughput'])}"
+        f"   peak {record['peak_memory_mb']:.1f} MB{change(record['peak_memory_mb'], previous and previous['peak_memory_mb'])}")
+  for key, value in record["details"].items():
+    print(f"{'':<10}{key}: {value}")
+
+def main(scenarios: list[str], scale: Scale, options: BenchOptions, results_path: str | None):
+  prepare_workspace(options.workspace)
+  history = load_history(results_path) if results_path else {}
+  scenario_options = {
+    "crawl": {"latency": options.server.latency, "jitter": options.server.jitter, "error_rate": options.server.error_rate,
+              "concurrency": options.concurrency, "max_rate": options.max_rate, "workers": options.workers,
+              "parse_workers": options.parse_workers, "parser": options.parser},
+    "parse": {"parser": options.parser, "sample": options.sample, "repeat": options.repeat},
+    "transform": {},
+    "load": {},
+  }
+  print(f"scale: {asdict(scale)}")
+  crawled = False
+  for name in scenarios:
+    if name == "crawl":
+      with StandinServer(scale, options.server) as base_url:
+        result = run_in_process(name, scale, options, base_url)
+      crawled = True
+    else:
+      if name in ("transform", "load") and not crawled:
+        # Same tournaments as a crawl would have written
+        write_tournaments(generate_tournaments(scale), os.path.join(options.workspace, "data_collection", "output"))
+        crawled = True
+      result = run_in_process(name, scale, options)
+    if name == "crawl" and "error" not in result:
+      # transform and load read what the crawl wrote
+      output = os.path.join(options.workspace, "data_collection", "output")
+      shutil.rmtree(output)
+      shutil.copytree(os.path.join(options.workspace, "crawl", "output"), output)
+    record = {
+      "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+      "commit": git_commit(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "scenario": name,
+      "scale": asdict(scale),
+      "options": scenario_options[name],
+      **result,
+    }
+    if "error" not in record:
+      record["throughput"] = round(record["items"] / record["elapsed"], 2) if record["elapsed"] > 0 else 0
+      record["elapsed"] = round(record["elapsed"], 3)
+      record["cpu"] = round(record["cpu"], 3)
+    print_result(record, history.get(run_key(record)))
+    if results_path and "error" not in record:
+      with open(results_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmarks of the crawl, parse, transform and load steps on synthetic data")
+  parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                      help=f"scenarios to run among {', '.join(SCENARIOS)} (default: all, load only with --dsn)")
+  add_scale_arguments(parser)
+  parser.add_argument("--latency", type=float, default=ServerOptions.latency, help="stand-in response latency, in seconds")
+  parser.add_argument("--jitter", type=float, default=ServerOptions.jitter, help="random extra latency, in seconds")
+  parser.add_argument("--error-rate", type=float, default=0, help="share of stand-in responses failing with 503 / 429")
+  parser.add_argument("--concurrency", type=int, default=BenchOptions.concurrency, help="crawl: http requests in flight")
+  parser.add_argument("--max-rate", type=float, default=BenchOptions.max_rate, help="crawl: requests per second")
+  parser.add_argument("--workers", type=int, default=BenchOptions.workers, help="crawl: tournaments at the same time")
+  parser.add_argument("--parse-workers", type=int, default=BenchOptions.parse_workers,
+                      help="crawl: html parsing processes (-1 = on the event loop, 0 = one per core)")
+  parser.add_argument("--parser", default=BenchOptions.parser, choices=["html.parser", "lxml", "html5lib"],
+                      help="BeautifulSoup parser backend for crawl and parse")
+  parser.add_argument("--sample", type=int, default=BenchOptions.sample, help="parse: tournaments whose pages are parsed")
+  parser.add_argument("--repeat", type=int, default=BenchOptions.repeat, help="parse: passes over the pages")
+  parser.add_argument("--dsn", help="PostgreSQL database for the load scenario; every table of the transformer is recreated")
+  parser.add_argument("--results", default=DEFAULT_RESULTS, help="json-lines history of the results")
+  parser.add_argument("--no-save", action="store_true", help="do not append the results to the history")
+  parser.add_argument("--workspace", help="directory for the crawl output and caches (default: a temporary directory)")
+  args = parser.parse_args()
+
+  scenarios = args.scenarios or ["crawl", "parse", "transform"] + (["load"] if args.dsn else [])
+  unknown = [name for name in scenarios if name not in SCENARIOS]
+  if unknown:
+    parser.error(f"unknown scenario: {', '.join(unknown)}")
+  if "load" in scenarios and not args.dsn:
+    parser.error("the load scenario needs --dsn")
+  workspace = args.workspace or tempfile.mkdtemp(prefix="bench_")
+  options = BenchOptions(
+    workspace=os.path.abspath(workspace),
+    server=ServerOptions(args.latency, args.jitter, args.error_rate),
+    concurrency=args.concurrency,
+    max_rate=args.max_rate,
+    workers=args.workers,
+    parse_workers=args.parse_workers,
+    parser=args.parser,
+    sample=args.sample,
+    repeat=args.repeat,
+    dsn=args.dsn,
+  )
+  try:
+    main(scenarios, scale_from_args(args), options, None if args.no_save else args.results)
+  finally:
+    if not args.workspace:
+      shutil.rmtree(workspace, ignore_errors=True)
@@ -0,0 +1,221 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLLECTION_DIR = os.path.join(ROOT, "data_collection")
+TRANSFORMATION_DIR = os.path.join(ROOT, "data_transformation")
+ALL_CARDS = os.path.join(COLLECTION_DIR, "all_cards.json")
+
+# Synthetic tournaments for the benchmarks
+# Each tournament has the dict shape written by the crawler (see decode_tournament in tournament_store.py: players
+# with their decklist, matches with their results), plus what the stand-in server needs to render its pages:
+# the whole standings (players without decklist included), the swiss rounds and the top cut bracket.
+# Generation is deterministic: the same scale and seed always give the same tournaments.
+
+@dataclass
+class Scale:
+  tournaments: int = 20
+  players: int = 32 # players per tournament
+  decklist_size: int = 20 # cards per deck, as 1 or 2 copies of each card
+  rounds: int = 5 # swiss rounds
+  top_cut: int = 8 # players of the single elimination bracket, 0 for none
+  decklist_ratio: float = 0.9 # share of players who published their decklist
+  archetypes: int = 16 # decks are built around a few shared cores, like a real metagame
+  seed: int = 1
+
+SCALES = {
+  "small": Scale(),
+  "medium": Scale(tournaments=200, players=64, rounds=6),
+  "large": Scale(tournaments=1000, players=128, rounds=7),
+}
+
+@dataclass
+class StandingsEntry:
+  id: str
+  name: str
+  placing: int
+  country: str
+  has_decklist: bool
+  wins: int = 0
+  losses: int = 0
+  ties: int = 0
+
+@dataclass
+class SyntheticTournament:
+  tournament: dict # same shape as a tournament written by the crawler
+  standings: list[StandingsEntry] # every player, in placing order
+  rounds: list[list[dict]] = field(default_factory=list) # matches of each swiss round
+  bracket: list[dict] = field(default_factory=list) # matches of the top cut
+
+COUNTRIES = ("FR", "US", "JP", "DE", "BR", "IT", "ES", "GB", "CA", "MX")
+ORGANIZERS = ("Pocket League", "Limitless Weekly", "Team Rocket Cup", "Pallet Town Series", "Kanto Open")
+
+def load_cards(path: str = ALL_CARDS) -> list[dict]:
+  with open(path, encoding="utf-8") as f:
+    return json.load(f)
+
+def decklist_item(card: dict, count: int) -> dict:
+  return {
+    "type": "Pokémon" if card["card_type"] == "Pokémon" else "Trainer",
+    "url": card["full_url"],
+    "name": card["name"],
+    "count": count,
+  }
+
+class TournamentGenerator:
+  def __init__(self, scale: Scale, cards: list[dict] | None = None):
+    self.scale = scale
+    self.random = random.Random(scale.seed)
+    cards = cards if cards is not None else load_cards()
+    self.pokemons = [c for c in cards if c["card_type"] == "Pokémon"]
+    self.trainers = [c for c in cards if c["card_type"] != "Pokémon"]
+    # Players come back from one tournament to the next
+    self.population = [f"player{i}" for i in range(max(scale.players * 4, 16))]
+    self.skill = {player_id: self.random.random() for player_id in self.population}
+    self.cores = [self.random.sample(self.pokemons, 4) + self.random.sample(self.trainers, 2)
+                  for _ in range(max(scale.archetypes, 1))]
+
+  # Core cards twice, then filler cards until the deck is full; Pokémon first, as on a decklist page
+  def decklist(self) -> list[dict]:
+    core = self.random.choice(self.cores)[:max(self.scale.decklist_size // 2, 1)]
+    cards = {card["full_url"]: [card, 2] for card in core}
+    total = 2 * len(cards)
+    while total < self.scale.decklist_size:
+      card = self.random.choice(self.pokemons if self.random.random() < 0.5 else self.trainers)
+      if card["full_url"] in cards:
+        continue
+      count = min(self.random.choice((1, 2)), self.scale.decklist_size - total)
+      cards[card["full_url"]] = [card, count]
+      total += count
+    items = [decklist_item(card, count) for card, count in cards.values()]
+    return [item for item in items if item["type"] == "Pokémon"] + [item for item in items if item["type"] != "Pokémon"]
+
+  # Best of 3: the most skilled player is more likely to win, and some matches end in a draw
+  def play(self, a: str, b: str) -> dict:
+    roll = self.random.random()
+    if roll < 0.05:
+      scores = (1, 1)
+    else:
+      a_wins = self.random.random() < 0.5 + (self.skill[a] - self.skill[b]) / 2
+      loser_score = self.random.choice((0, 1))
+      scores = (2, loser_score) if a_wins else (loser_score, 2)
+    return {"match_results": [{"player_id": a, "score": scores[0]}, {"player_id": b, "score": scores[1]}]}
+
+  def record(self, standings: dict, match: dict):
+    a, b = match["match_results"]
+    if a["score"] == b["score"]:
+      standings[a["player_id"]].ties += 1
+      standings[b["player_id"]].ties += 1
+    else:
+      winner, loser = (a, b) if a["score"] > b["score"] else (b, a)
+      standings[winner["player_id"]].wins += 1
+      standings[loser["player_id"]].losses += 1
+
+  def generate(self, index: int) -> SyntheticTournament:
+    scale = self.scale
+    tournament_id = f"{self.random.getrandbits(96):024x}"
+    date = datetime(2025, 6, 1, 18) - timedelta(hours=6 * index)
+    player_ids = self.random.sample(self.population, min(scale.players, len(self.population)))
+    standings = {
+      player_id: StandingsEntry(player_id, player_id.capitalize(), 0, self.random.choice(COUNTRIES),
+                                self.random.random() < scale.decklist_ratio)
+      for player_id in player_ids
+    }
+    decklists = {player_id: self.decklist() for player_id in player_ids if standings[player_id].has_decklist}
+
+    # Swiss rounds: players with the same number of points meet, the odd one out gets a bye
+    rounds = []
+    for _ in range(scale.rounds):
+      order = sorted(player_ids, key=lambda p: (-(3 * standings[p].wins + standings[p].ties), self.random.random()))
+      matches = [self.play(a, b) for a, b in zip(order[::2], order[1::2])]
+      for match in matches:
+        self.record(standings, match)
+      rounds.append(matches)
+
+    ranking = sorted(player_ids, key=lambda p: (-(3 * standings[p].wins + standings[p].ties), p))
+    for placing, player_id in enumerate(ranking, 1):
+      standings[player_id].placing = placing
+
+    # Top cut: single elimination between the best players, 1 against 8, 2 against 7…
+    bracket = []
+    alive = ranking[:scale.top_cut] if scale.top_cut >= 2 else []
+    while len(alive) >= 2:
+      winners = []
+      for a, b in zip(alive[:len(alive) // 2], reversed(alive[len(alive) // 2:])):
+        match = self.play(a, b)
+        while match["match_results"][0]["score"] == match["match_results"][1]["score"]:
+          match = self.play(a, b)
+        bracket.append(match)
+        winners.append(a if match["match_results"][0]["score"] > match["match_results"][1]["score"] else b)
+      alive = winners
+
+    players = [
+      {"id": p, "name": standings[p].name, "placing": str(standings[p].placing), "country": standings[p].country,
+       "decklist": decklists[p]}
+      for p in ranking if p in decklists
+    ]
+    tournament = {
+      "id": tournament_id,
+      "name": f"{self.random.choice(ORGANIZERS)} #{index + 1}",
+      "date": date.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+      "organizer": self.random.choice(ORGANIZERS),
+      "format": "STANDARD",
+      "nb_players": str(len(player_ids)),
+      "players": players,
+      "matches": [match for matches in rounds for match in matches] + bracket,
+    }
+    return SyntheticTournament(tournament, [standings[p] for p in ranking], rounds, bracket)
+
+  # Tournaments from the newest to the oldest, like the completed tournaments list
+  def __iter__(self):
+    for index in range(self.scale.tournaments):
+      yield self.generate(index)
+
+def generate_tournaments(scale: Scale) -> list[SyntheticTournament]:
+  return list(TournamentGenerator(scale))
+
+# Write the tournaments as the crawler would: in a tournaments.pack store, or as legacy {id}.json files
+def write_tournaments(tournaments: list[SyntheticTournament], output: str, as_json: bool = False):
+  if as_json:
+    os.makedirs(output, exist_ok=True)
+    for synthetic in tournaments:
+      with open(os.path.join(output, f"{synthetic.tournament['id']}.json"), "w", encoding="utf-8") as f:
+        json.dump(synthetic.tournament, f)
+    return
+  if COLLECTION_DIR not in sys.path:
+    sys.path.insert(0, COLLECTION_DIR)
+  from tournament_store import TournamentStore
+  store = TournamentStore(os.path.join(output, "tournaments.pack"))
+  for synthetic in tournaments:
+    store.append(synthetic.tournament)
+
+def add_scale_arguments(parser: argparse.ArgumentParser):
+  parser.add_argument("--scale", choices=list(SCALES), default="small", help="preset size of the data set")
+  parser.add_argument("--tournaments", type=int, help="number of tournaments")
+  parser.add_argument("--players", type=int, help="players per tournament")
+  parser.add_argument("--decklist-size", type=int, help="cards per deck")
+  parser.add_argument("--rounds", type=int, help="swiss rounds per tournament")
+  parser.add_argument("--top-cut", type=int, help="players in the top cut bracket (0 for none)")
+  parser.add_argument("--seed", type=int, help="random seed")
+
+def scale_from_args(args) -> Scale:
+  scale = SCALES[args.scale]
+  overrides = {name: getattr(args, name) for name in ("tournaments", "players", "decklist_size", "rounds", "top_cut", "seed")
+               if getattr(args, name) is not None}
+  return Scale(**{**scale.__dict__, **overrides})
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Generate synthetic tournaments in the crawler's output format")
+  add_scale_arguments(parser)
+  parser.add_argument("--output", default="bench_output", help="directory to write the tournaments to")
+  parser.add_argument("--json", action="store_true", help="write one {id}.json file per tournament instead of a pack")
+  args = parser.parse_args()
+  scale = scale_from_args(args)
+  tournaments = generate_tournaments(scale)
+  write_tournaments(tournaments, args.output, args.json)
+  print(f"{len(tournaments)} tournaments written to {args.output}")
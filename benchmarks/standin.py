@@ -0,0 +1,264 @@
+from dataclasses import dataclass
+from html import escape
+import argparse
+import asyncio
+import multiprocessing
+import random
+
+from aiohttp import web
+
+from generator import SyntheticTournament, Scale, add_scale_arguments, generate_tournaments, scale_from_args
+
+# Local stand-in for play.limitlesstcg.com, serving synthetic tournaments (see generator.py)
+# Pages have the markup the crawler's parsers look for (completed tournaments list, standings, decklists,
+# swiss pairings and top cut bracket) inside a site layout of a realistic size, so that parse times are
+# representative. Every response is delayed by the configured latency, and a share of them can fail with
+# 503 / 429 to exercise the retry path.
+
+@dataclass
+class ServerOptions:
+  latency: float = 0.02 # seconds added to every response
+  jitter: float = 0.01 # random extra latency, up to this many seconds
+  error_rate: float = 0 # share of responses replaced by a 503 or 429 with Retry-After: 0
+  per_page: int = 50 # tournaments per list page
+
+NAV_LINKS = "".join(
+  f'<li><a href="/{section}">{section.replace("-", " ").title()}</a></li>'
+  for section in ("tournaments", "tournaments/upcoming", "decks", "cards", "players", "organizers", "rankings",
+                  "articles", "tools", "about", "account", "help", "privacy", "terms", "contact")
+)
+
+SCRIPT = "window.dataLayer=window.dataLayer||[];" + "".join(
+  f"function f{i}(e){{var t=document.querySelectorAll('.row-{i}');for(var n=0;n<t.length;n++)t[n].classList.toggle('hidden',e)}}"
+  for i in range(40)
+)
+
+def page(title: str, content: str) -> str:
+  return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{escape(title)} | Limitless</title>
+<link rel="stylesheet" href="/static/css/main.css">
+<link rel="icon" href="/static/favicon.png">
+<script async src="/static/js/analytics.js"></script>
+</head>
+<body>
+<header class="header"><nav class="main-nav"><a class="logo" href="/">Limitless</a><ul>{NAV_LINKS}</ul></nav></header>
+<div class="container">
+{content}
+</div>
+<footer class="footer"><ul>{NAV_LINKS}</ul><p>Pokémon and its trademarks are ©1995-2025 Nintendo, Creatures, and GAMEFREAK.</p></footer>
+<script>{SCRIPT}</script>
+</body>
+</html>"""
+
+def render_tournament_list(tournaments: list[SyntheticTournament], page_number: int, per_page: int) -> str:
+  max_page = max((len(tournaments) + per_page - 1) // per_page, 1)
+  rows = []
+  for synthetic in tournaments[(page_number - 1) * per_page:page_number * per_page]:
+    t = synthetic.tournament
+    winner = synthetic.standings[0]
+    rows.append(
+      f'<tr data-date="{t["date"]}" data-name="{escape(t["name"])}" data-organizer="{escape(t["organizer"])}" '
+      f'data-format="{t["format"]}" data-players="{t["nb_players"]}">'
+      f'<td>{t["date"][:10]}</td>'
+      f'<td><a href="/tournament/{t["id"]}/standings">{escape(t["name"])}</a></td>'
+      f'<td><a href="/organizer/{escape(t["organizer"])}">{escape(t["organizer"])}</a></td>'
+      f'<td>{t["nb_players"]}</td>'
+      f'<td><a href="/tournament/{t["id"]}/player/{winner.id}">{escape(winner.name)}</a></td></tr>'
+    )
+  pages = "".join(f'<li><a href="/tournaments/completed?page={n}">{n}</a></li>' for n in range(1, max_page + 1)[:10])
+  return page("Completed Tournaments", f"""
+<h1>Completed Tournaments</h1>
+<table class="completed-tournaments">
+<tr><th>Date</th><th>Name</th><th>Organizer</th><th>Players</th><th>Winner</th></tr>
+{"".join(rows)}
+</table>
+<ul class="pagination" data-current="{page_number}" data-max="{max_page}">{pages}</ul>""")
+
+def render_standings(synthetic: SyntheticTournament) -> str:
+  t = synthetic.tournament
+  rows = []
+  for entry in synthetic.standings:
+    decklist = (f'<a href="/tournament/{t["id"]}/player/{entry.id}/decklist"><img class="pokemon" src="/static/deck.png"></a>'
+                if entry.has_decklist else "")
+    rows.append(
+      f'<tr data-name="{escape(entry.name)}" data-placing="{entry.placing}" data-country="{entry.country}">'
+      f'<td>{entry.placing}</td>'
+      f'<td><a href="/tournament/{t["id"]}/player/{entry.id}">{escape(entry.name)}</a></td>'
+      f'<td><img class="flag" src="/static/flags/{entry.country}.png" alt="{entry.country}"></td>'
+      f'<td>{3 * entry.wins + entry.ties}</td>'
+      f'<td>{entry.wins} - {entry.losses} - {entry.ties}</td>'
+      f'<td>{decklist}</td></tr>'
+    )
+  return page(t["name"], f"""
+<div class="tournament-header"><h1>{escape(t["name"])}</h1><p>{t["date"][:10]} · {t["nb_players"]} players</p></div>
+<table class="striped">
+<tr><th>#</th><th>Name</th><th>Country</th><th>Points</th><th>Record</th><th>Deck</th></tr>
+{"".join(rows)}
+</table>""")
+
+def render_decklist(synthetic: SyntheticTournament, player: dict) -> str:
+  columns = []
+  for deck_type in ("Pokémon", "Trainer"):
+    cards = [card for card in player["decklist"] if card["type"] == deck_type]
+    if not cards:
+      continue
+    links = "".join(f'<a href="{card["url"]}">{card["count"]} {escape(card["name"])}</a>' for card in cards)
+    columns.append(f'<div class="column"><div class="heading">{deck_type} ({sum(card["count"] for card in cards)})</div>'
+                   f'<div class="cards">{links}</div></div>')
+  return page(f'{player["name"]} - {synthetic.tournament["name"]}', f"""
+<h1>{escape(player["name"])}</h1>
+<div class="decklist">{"".join(columns)}</div>""")
+
+def pairings_url(tournament_id: str, round_number: int | None = None) -> str:
+  return f"/tournament/{tournament_id}/pairings" + (f"?round={round_number}" if round_number else "")
+
+# Links to every phase of the tournament, the current one (bracket, or else the last round) last
+def render_mini_nav(synthetic: SyntheticTournament) -> str:
+  tournament_id = synthetic.tournament["id"]
+  links = [f'<a href="{pairings_url(tournament_id, n)}">Round {n}</a>' for n in range(1, len(synthetic.rounds) + 1)]
+  if synthetic.bracket:
+    links.append(f'<a href="{pairings_url(tournament_id)}">Top Cut</a>')
+  return f'<div class="mini-nav">{"".join(links)}</div>'
+
+def render_round(synthetic: SyntheticTournament, round_number: int) -> str:
+  names = {entry.id: entry.name for entry in synthetic.standings}
+  rows = []
+  for match in synthetic.rounds[round_number - 1]:
+    p1, p2 = match["match_results"]
+    rows.append(
+      f'<tr data-completed="1"><td>{len(rows) + 1}</td>'
+      f'<td class="p1" data-id="{p1["player_id"]}" data-count="{p1["score"]}">{escape(names[p1["player_id"]])}</td>'
+      f'<td class="score">{p1["score"]} - {p2["score"]}</td>'
+      f'<td class="p2" data-id="{p2["player_id"]}" data-count="{p2["score"]}">{escape(names[p2["player_id"]])}</td></tr>'
+    )
+  return page(synthetic.tournament["name"], f"""
+{render_mini_nav(synthetic)}
+<div class="pairings"><table data-tournament="{synthetic.tournament["id"]}">
+<tr><th>Table</th><th>Player 1</th><th>Score</th><th>Player 2</th></tr>
+{"".join(rows)}
+</table></div>""")
+
+def render_bracket(synthetic: SyntheticTournament) -> str:
+  names = {entry.id: entry.name for entry in synthetic.standings}
+  matches = []
+  for match in synthetic.bracket:
+    players = "".join(
+      f'<div class="live-bracket-player" data-id="{result["player_id"]}"><span>{escape(names[result["player_id"]])}</span>'
+      f'<div class="score" data-score="{result["score"]}">{result["score"]}</div></div>'
+      for result in match["match_results"]
+    )
+    matches.append(f'<div class="bracket-match">{players}</div>')
+  return page(synthetic.tournament["name"], f"""
+{render_mini_nav(synthetic)}
+<div class="live-bracket">{"".join(matches)}</div>""")
+
+def render_pairings(synthetic: SyntheticTournament, round_number: int | None) -> str:
+  if round_number is None:
+    if synthetic.bracket:
+      return render_bracket(synthetic)
+    round_number = len(synthetic.rounds)
+  return render_round(synthetic, round_number)
+
+def make_app(tournaments: list[SyntheticTournament], options: ServerOptions) -> web.Application:
+  by_id = {synthetic.tournament["id"]: synthetic for synthetic in tournaments}
+  players = {(synthetic.tournament["id"], player["id"]): player
+             for synthetic in tournaments for player in synthetic.tournament["players"]}
+  rng = random.Random(0)
+
+  def tournament(request: web.Request) -> SyntheticTournament:
+    synthetic = by_id.get(request.match_info["tournament_id"])
+    if synthetic is None:
+      raise web.HTTPNotFound()
+    return synthetic
+
+  def html(text: str) -> web.Response:
+    return web.Response(text=text, content_type="text/html")
+
+  @web.middleware
+  async def delay(request: web.Request, handler):
+    await asyncio.sleep(options.latency + rng.uniform(0, options.jitter))
+    if options.error_rate and rng.random() < options.error_rate:
+      return web.Response(status=rng.choice((429, 503)), headers={"Retry-After": "0"})
+    return await handler(request)
+
+  async def tournament_list(request: web.Request):
+    return html(render_tournament_list(tournaments, int(request.query.get("page", 1)), options.per_page))
+
+  async def standings(request: web.Request):
+    return html(render_standings(tournament(request)))
+
+  async def decklist(request: web.Request):
+    synthetic = tournament(request)
+    player = players.get((synthetic.tournament["id"], request.match_info["player_id"]))
+    if player is None:
+      raise web.HTTPNotFound()
+    return html(render_decklist(synthetic, player))
+
+  async def pairings(request: web.Request):
+    synthetic = tournament(request)
+    round_number = request.query.get("round")
+    return html(render_pairings(synthetic, int(round_number) if round_number else None))
+
+  app = web.Application(middlewares=[delay])
+  app.router.add_get("/tournaments/completed", tournament_list)
+  app.router.add_get("/tournament/{tournament_id}/standings", standings)
+  app.router.add_get("/tournament/{tournament_id}/player/{player_id}/decklist", decklist)
+  app.router.add_get("/tournament/{tournament_id}/pairings", pairings)
+  return app
+
+# Serve until cancelled; port 0 picks a free port. on_ready receives the base url once listening
+async def serve(tournaments: list[SyntheticTournament], options: ServerOptions, host: str = "127.0.0.1",
+                port: int = 0, on_ready=None):
+  runner = web.AppRunner(make_app(tournaments, options), access_log=None)
+  await runner.setup()
+  site = web.TCPSite(runner, host, port)
+  await site.start()
+  bound_host, bound_port = runner.addresses[0][:2]
+  try:
+    if on_ready is not None:
+      on_ready(f"http://{bound_host}:{bound_port}")
+    await asyncio.Event().wait()
+  finally:
+    await runner.cleanup()
+
+def serve_process(scale: Scale, options: ServerOptions, connection):
+  asyncio.run(serve(generate_tournaments(scale), options, on_ready=connection.send))
+
+# Stand-in server in a separate process, so that it does not share the event loop or the CPU of the crawl
+# Usage: with StandinServer(scale, options) as base_url: ...
+class StandinServer:
+  def __init__(self, scale: Scale, options: ServerOptions):
+    self.scale = scale
+    self.options = options
+    self.process = None
+
+  def __enter__(self) -> str:
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    self.process = context.Process(target=serve_process, args=(self.scale, self.options, sender), daemon=True)
+    self.process.start()
+    return receiver.recv()
+
+  def __exit__(self, *exc):
+    self.process.terminate()
+    self.process.join()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Serve synthetic tournaments with the markup of play.limitlesstcg.com")
+  add_scale_arguments(parser)
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8080)
+  parser.add_argument("--latency", type=float, default=ServerOptions.latency, help="seconds added to every response")
+  parser.add_argument("--jitter", type=float, default=ServerOptions.jitter, help="random extra latency, in seconds")
+  parser.add_argument("--error-rate", type=float, default=0, help="share of responses failing with 503 / 429")
+  args = parser.parse_args()
+  options = ServerOptions(args.latency, args.jitter, args.error_rate)
+  try:
+    asyncio.run(serve(generate_tournaments(scale_from_args(args)), options, args.host, args.port,
+                      on_ready=lambda url: print(f"serving on {url}, crawl with: python main.py --base-url {url} --no-proxy")))
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,310 @@
+from collections import Counter
+from dataclasses import dataclass, asdict
+import aiohttp
+import argparse
+import asyncio
+import json
+import os
+import re
+
+from crawl_metrics import CrawlMetrics
+from http_client import HttpClient
+from main import CrawlConfig, CrawlContext, async_html_from_url, headers, parse_parts
+from page_cache import PageCache
+
+# Card database crawler: refreshes all_cards.json and extensions.json from pocket.limitlesstcg.com
+#
+# The sets list page gives the card count of every set. A set whose count matches extensions.json, and
+# which has that many cards in all_cards.json, is left as is without fetching any of its pages. For the
+# other sets (new ones, or sets that gained cards), the set page lists the card urls and only cards that
+# are not in all_cards.json yet are fetched. Pages go through the same http client and html cache as
+# the tournament crawler: card pages never change and are cached forever, the sets list and set pages
+# expire after --list-ttl seconds.
+# Both files are written to a temporary file and renamed, all_cards.json first: extensions.json holds
+# the card counts used as change check, so a crash between the two renames only causes a recheck.
+
+cards_base_url = "https://pocket.limitlesstcg.com"
+default_cards_path = "all_cards.json"
+default_extensions_path = "extensions.json"
+
+# An entry of extensions.json
+@dataclass
+class Extension:
+  code: str
+  name: str
+  release_date: str
+  card_count: int
+  url: str
+
+# An entry of all_cards.json
+@dataclass
+class Card:
+  full_url: str
+  name: str
+  card_type: str
+  stage: str
+  evolves_from: str
+  element_type: str
+  hp: str
+  attack: str
+  attack_effect: str
+  ability: str
+  ability_effect: str
+  weakness: str
+  retreat: str
+  illustrator: str
+  flavor_text: str
+  extension: str
+
+regex_set_url = re.compile(r'^/cards/[a-zA-Z0-9_\-]+$')
+regex_weakness = re.compile(r'Weakness:\s*(.*?)\s*(?:Retreat:|$)')
+regex_retreat = re.compile(r'Retreat:\s*(\d+)')
+
+SETS_PARTS = ("sets-table",)
+SET_PARTS = ("card-search-grid",)
+CARD_PARTS = ("card-text",)
+
+def clean_text(tag) -> str:
+  return " ".join(tag.get_text(" ").split()) if tag is not None else ""
+
+def card_set_code(url: str) -> str:
+  parts = url.split('/cards/')
+  return parts[1].split('/')[0] if len(parts) > 1 else ''
+
+# Label of a set in all_cards.json, "Genetic Apex  (A1)"
+def extension_label(extension: Extension) -> str:
+  return f"{extension.name}  ({extension.code})"
+
+# Page parsers, same contract as the ones of main.py (raw html in, plain dataclasses out)
+
+def parse_card_sets_page(html: str, parser: str, base_url: str) -> list[Extension]:
+  soup = parse_parts(html, parser, SETS_PARTS)
+  try:
+    extensions = []
+    for set_tr in soup.find_all("tr"):
+      link = set_tr.find("a", {'href': regex_set_url})
+      tds = set_tr.find_all("td")
+      if link is None or len(tds) < 3:
+        continue # header and section rows
+      code = link.attrs["href"].split('/')[2]
+      name = " ".join(" ".join(link.find_all(string=True, recursive=False)).split())
+      card_count = re.sub(r'\D', '', tds[2].get_text())
+      extensions.append(Extension(code, name, clean_text(tds[1]), int(card_count or 0), f"{base_url}/cards/{code}"))
+  finally:
+    soup.decompose()
+  return extensions
+
+# Return the absolute urls of the cards of a set page, in page order
+def parse_card_set_page(html: str, parser: str, base_url: str, code: str) -> list[str]:
+  soup = parse_parts(html, parser, SET_PARTS)
+  try:
+    regex_card_url = re.compile(rf'^/cards/{re.escape(code)}/[a-zA-Z0-9_\-]+$')
+    urls = dict.fromkeys(base_url + link.attrs["href"] for link in soup.find_all("a", {'href': regex_card_url}))
+  finally:
+    soup.decompose()
+  return list(urls)
+
+# Title: "Name - Element - 60 HP" for a Pokémon, "Name" or "Name - 40 HP" for a Trainer
+# Type: "Pokémon - Stage 1 - Evolves from Name" or "Trainer - Item"
+# Only the first attack is kept, like the original export
+def parse_card_page(html: str, parser: str, url: str, label: str) -> Card:
+  soup = parse_parts(html, parser, CARD_PARTS)
+  try:
+    name = clean_text(soup.find(class_="card-text-name"))
+    title = clean_text(soup.find(class_="card-text-title")).split(" - ")[1:]
+    hp = next((part.removesuffix(" HP") for part in title if part.endswith(" HP")), "")
+    element_type = next((part for part in title if not part.endswith(" HP")), "")
+    card_type, *details = clean_text(soup.find(class_="card-text-type")).split(" - ")
+    is_pokemon = card_type == "Pokémon"
+    stage = details[0] if is_pokemon and details else ""
+    evolves_from = details[1].removeprefix("Evolves from ") if is_pokemon and len(details) > 1 else ""
+
+    attack, attack_effect = "", ""
+    attack_div = soup.find(class_="card-text-attack")
+    if attack_div is not None:
+      info = attack_div.find(class_="card-text-attack-info")
+      for symbol in info.find_all(class_="ptcg-symbol"):
+        symbol.decompose()
+      attack = clean_text(info)
+      attack_effect = clean_text(attack_div.find(class_="card-text-attack-effect"))
+
+    ability, ability_effect = "", ""
+    ability_div = soup.find(class_="card-text-ability")
+    if ability_div is not None:
+      ability = clean_text(ability_div.find(class_="card-text-ability-info")).removeprefix("Ability:").strip()
+      ability_effect = clean_text(ability_div.find(class_="card-text-ability-effect"))
+
+    wrr = clean_text(soup.find(class_="card-text-wrr"))
+    weakness = regex_weakness.search(wrr)
+    retreat = regex_retreat.search(wrr)
+    artist = soup.find(class_="card-text-artist")
+
+    return Card(
+      url,
+      name,
+      card_type,
+      stage,
+      evolves_from,
+      element_type,
+      hp,
+      attack,
+      attack_effect,
+      ability,
+      ability_effect,
+      weakness.group(1) if weakness else "",
+      retreat.group(1) if retreat else "",
+      clean_text(artist.find("a") if artist is not None else None),
+      clean_text(soup.find(class_="card-text-flavor")),
+      label
+    )
+  finally:
+    soup.decompose()
+
+def load_json(path: str) -> list:
+  if not os.path.isfile(path):
+    return []
+  with open(path, encoding="utf-8") as f:
+    return json.load(f)
+
+def write_json_atomic(path: str, data: list):
+  tmp_path = f"{path}.tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(data, f, indent=2, ensure_ascii=False)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+# A set is up to date when its card count did not change and all of its cards are already known
+def is_up_to_date(extension: Extension, known: dict, cards_per_set: Counter) -> bool:
+  previous = known.get(extension.code)
+  return (previous is not None and previous.get("card_count") == extension.card_count
+          and cards_per_set[extension.code] == extension.card_count)
+
+async def fetch_card(ctx: CrawlContext, url: str, label: str) -> dict:
+  html = await async_html_from_url(ctx, url)
+  return asdict(await ctx.parse(parse_card_page, html, url, label))
+
+# Cards of a set that is new or changed, in set page order: known cards are reused, the others are fetched
+async def fetch_set_cards(ctx: CrawlContext, base_url: str, extension: Extension, label: str,
+                          cards_by_url: dict) -> list[dict]:
+  html = await async_html_from_url(ctx, extension.url, ttl=ctx.list_page_ttl)
+  urls = await ctx.parse(parse_card_set_page, html, base_url, extension.code)
+  new_urls = [url for url in urls if url not in cards_by_url]
+  fetched = await asyncio.gather(*[fetch_card(ctx, url, label) for url in new_urls])
+  print(f"set {extension.code}: {len(urls)} cards, {len(new_urls)} fetched")
+  cards = {**cards_by_url, **{card["full_url"]: card for card in fetched}}
+  return [cards[url] for url in urls]
+
+# Update both files; full: check every set, even those whose card count did not change
+# Return the number of sets checked and the number of cards added
+async def crawl_cards(ctx: CrawlContext, base_url: str, cards_path: str, extensions_path: str,
+                      full: bool = False) -> tuple[int, int]:
+  old_cards = load_json(cards_path)
+  old_extensions = load_json(extensions_path)
+  known = {extension["code"]: extension for extension in old_extensions}
+  cards_by_url = {card["full_url"]: card for card in old_cards}
+  cards_per_set = Counter(card_set_code(card["full_url"]) for card in old_cards)
+  # Sets keep the label of their existing cards
+  labels = {card_set_code(card["full_url"]): card["extension"] for card in reversed(old_cards)}
+
+  html = await async_html_from_url(ctx, f"{base_url}/cards", ttl=ctx.list_page_ttl)
+  extensions = await ctx.parse(parse_card_sets_page, html, base_url)
+  if not extensions:
+    raise Exception("No set found on the sets page")
+
+  changed = [extension for extension in extensions if full or not is_up_to_date(extension, known, cards_per_set)]
+  print(f"{len(extensions)} sets, {len(changed)} new or changed")
+  set_cards = await asyncio.gather(*[
+    fetch_set_cards(ctx, base_url, extension, labels.get(extension.code) or extension_label(extension), cards_by_url)
+    for extension in changed
+  ])
+  set_cards = {extension.code: cards for extension, cards in zip(changed, set_cards)}
+
+  # Sets in the order of the sets page, then the sets that are no longer listed
+  cards = []
+  codes = [extension.code for extension in extensions]
+  for code in codes + [code for code in cards_per_set if code not in codes]:
+    if code in set_cards:
+      cards.extend(set_cards[code])
+    else:
+      cards.extend(card for card in old_cards if card_set_code(card["full_url"]) == code)
+  extensions_rows = [asdict(extension) for extension in extensions]
+  extensions_rows.extend(extension for code, extension in known.items() if code not in codes)
+
+  if changed:
+    write_json_atomic(cards_path, cards)
+  if extensions_rows != old_extensions:
+    write_json_atomic(extensions_path, extensions_rows)
+  return len(changed), len(cards) - len(old_cards)
+
+# Options of a card database refresh, shared with the tournament crawler where they have the same meaning
+@dataclass
+class CardCrawlConfig:
+  base_url: str = cards_base_url
+  concurrency: int = 10
+  max_rate: float = 10
+  timeout: float = 30
+  retries: int = 5
+  proxy: str | None = CrawlConfig.proxy
+  parser: str = "html.parser"
+  cache_path: str = "cache/pages.sqlite"
+  list_page_ttl: float = 3600
+  cards_path: str = default_cards_path
+  extensions_path: str = default_extensions_path
+  full: bool = False
+  metrics_path: str | None = None
+
+async def main(config: CardCrawlConfig):
+  connector = aiohttp.TCPConnector(limit=config.concurrency)
+  cache = PageCache(config.cache_path)
+  metrics = CrawlMetrics()
+  try:
+    # Card pages are requested with absolute urls, so this session has no base_url
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+      client = HttpClient(session, config.concurrency, config.max_rate, config.timeout, config.retries, proxy=config.proxy)
+      ctx = CrawlContext(client, cache, None, metrics, None, config.parser, config.list_page_ttl)
+      nb_sets, added = await crawl_cards(ctx, config.base_url.rstrip("/"), config.cards_path, config.extensions_path,
+                                         config.full)
+      print(f"{nb_sets} sets updated, {added} cards added")
+  finally:
+    cache.close()
+    metrics.print_summary()
+    if config.metrics_path:
+      metrics.write_summary(config.metrics_path)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Refresh all_cards.json and extensions.json from Limitless TCG Pocket")
+  parser.add_argument("--base-url", default=cards_base_url, help="card database site (default: %(default)s)")
+  parser.add_argument("--concurrency", type=int, default=10, help="maximum number of http requests in flight")
+  parser.add_argument("--max-rate", type=float, default=10, help="maximum requests per second to the site")
+  parser.add_argument("--timeout", type=float, default=30, help="timeout of an http request, in seconds")
+  parser.add_argument("--retries", type=int, default=5, help="retries of a failed http request")
+  proxy = parser.add_mutually_exclusive_group()
+  proxy.add_argument("--proxy", default=CrawlConfig.proxy, help="http proxy (default: %(default)s)")
+  proxy.add_argument("--no-proxy", dest="proxy", action="store_const", const=None, help="connect directly")
+  parser.add_argument("--parser", default="html.parser", choices=["html.parser", "lxml", "html5lib"],
+                      help="BeautifulSoup parser backend")
+  parser.add_argument("--cache", default="cache/pages.sqlite", help="path of the html cache database")
+  parser.add_argument("--list-ttl", type=float, default=3600,
+                      help="seconds the sets list and set pages stay in the cache")
+  parser.add_argument("--cards", default=default_cards_path, help="path of all_cards.json")
+  parser.add_argument("--extensions", default=default_extensions_path, help="path of extensions.json")
+  parser.add_argument("--full", action="store_true",
+                      help="check every set, not only those whose card count changed")
+  parser.add_argument("--metrics", default=None, help="where to write the json summary of cache and fetch metrics")
+  args = parser.parse_args()
+  asyncio.run(main(CardCrawlConfig(
+    base_url=args.base_url,
+    concurrency=args.concurrency,
+    max_rate=args.max_rate,
+    timeout=args.timeout,
+    retries=args.retries,
+    proxy=args.proxy,
+    parser=args.parser,
+    cache_path=args.cache,
+    list_page_ttl=args.list_ttl,
+    cards_path=args.cards,
+    extensions_path=args.extensions,
+    full=args.full,
+    metrics_path=args.metrics,
+  )))
@@ -0,0 +1,117 @@
+import json
+import os
+import sqlite3
+import time
+
+# Journal of the crawl, stored in a SQLite file next to the tournaments
+#
+# tournaments: one row per listed tournament with its listing (to queue it again without its list page) and
+# its state: listed -> standings -> decklists -> pairings -> written, or skipped (no decklist / already stored)
+# or failed with the reason and the number of attempts
+# progress: state of the crawl itself: whether it is running or done, the next list page to fetch and the
+# newest listed tournament (the future watermark)
+#
+# A crawl that stops halfway (crash, ctrl-c) is resumed by the next run: unfinished tournaments are queued
+# first, straight from the journal, then paging continues at the next list page. The pages of a tournament
+# interrupted in the middle of its steps are all in the page cache, so handling it again costs no request.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tournaments (
+  id TEXT PRIMARY KEY,
+  listing TEXT NOT NULL,
+  state TEXT NOT NULL,
+  reason TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tournaments_state ON tournaments(state);
+CREATE TABLE IF NOT EXISTS progress (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+"""
+
+STATES = ("listed", "standings", "decklists", "pairings", "written", "skipped", "failed")
+FINISHED_STATES = ("written", "skipped")
+
+class CrawlJournal:
+  def __init__(self, path: str = "output/crawl_journal.sqlite"):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+    self.db.executescript(SCHEMA)
+
+  def close(self):
+    self.db.close()
+
+  def get(self, key: str):
+    row = self.db.execute("SELECT value FROM progress WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row is not None else None
+
+  def set(self, key: str, value):
+    self.db.execute("INSERT OR REPLACE INTO progress (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+    self.db.commit()
+
+  # Start a crawl, or resume the one left running by a previous run
+  # Return the list page to start from
+  def begin(self, resume: bool = True) -> int:
+    if resume and self.get("status") == "running":
+      return self.get("next_page") or 1
+    self.db.executemany(
+      "INSERT OR REPLACE INTO progress (key, value) VALUES (?, ?)",
+      [("status", json.dumps("running")), ("next_page", json.dumps(1)), ("newest", json.dumps(None))]
+    )
+    self.db.commit()
+    return 1
+
+  def finish(self):
+    self.set("status", "done")
+
+  # Every listing of a list page has been journaled, the next run can resume after it
+  def page_done(self, page: int):
+    self.set("next_page", page + 1)
+
+  # Record newly listed tournaments, keeping the state of those already known
+  # Return the listings still to handle: not finished, and not failed max_attempts times already
+  def add_listings(self, listings: list[dict], max_attempts: int) -> list[dict]:
+    now = time.time()
+    self.db.executemany(
+      "INSERT OR IGNORE INTO tournaments (id, listing, state, updated_at) VALUES (?, ?, 'listed', ?)",
+      [(listing["id"], json.dumps(listing), now) for listing in listings]
+    )
+    self.db.commit()
+    ids = [listing["id"] for listing in listings]
+    done = {row[0] for row in self.db.execute(
+      f"SELECT id FROM tournaments WHERE id IN ({','.join('?' * len(ids))}) "
+      f"AND (state IN ({','.join('?' * len(FINISHED_STATES))}) OR (state = 'failed' AND attempts >= ?))",
+      (*ids, *FINISHED_STATES, max_attempts)
+    )}
+    return [listing for listing in listings if listing["id"] not in done]
+
+  def set_state(self, tournament_id: str, state: str, reason: str | None = None):
+    assert state in STATES
+    self.db.execute(
+      "UPDATE tournaments SET state = ?, reason = ?, updated_at = ?, attempts = attempts + ? WHERE id = ?",
+      (state, reason, time.time(), 1 if state == "failed" else 0, tournament_id)
+    )
+    self.db.commit()
+
+  # Listings of the tournaments to handle before paging: interrupted ones, and failed ones that have not
+  # used up their attempts
+  def pending(self, max_attempts: int) -> list[dict]:
+    rows = self.db.execute(
+      f"SELECT listing FROM tournaments WHERE state NOT IN ({','.join('?' * len(FINISHED_STATES))}) "
+      "AND (state != 'failed' OR attempts < ?) ORDER BY updated_at",
+      (*FINISHED_STATES, max_attempts)
+    ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+  def failures(self) -> list[tuple[str, str, int]]:
+    return self.db.execute("SELECT id, reason, attempts FROM tournaments WHERE state = 'failed' ORDER BY id").fetchall()
+
+  def counts(self) -> dict[str, int]:
+    return dict(self.db.execute("SELECT state, COUNT(*) FROM tournaments GROUP BY state").fetchall())
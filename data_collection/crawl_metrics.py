@@ -0,0 +1,178 @@
+from collections import defaultdict
+import json
+import math
+import time
+from urllib.parse import urlsplit
+
+# Instrumentation of the crawler
+# Counters and latency histograms per page type (tournament_list, standings, decklist, pairings, and the
+# card_sets, card_set and card pages of the card database crawler),
+# written as a json summary at the end of the run, plus an optional json-lines trace of every event
+
+PAGE_TYPES = ("tournament_list", "standings", "decklist", "pairings", "card_sets", "card_set", "card")
+
+def page_type(url: str) -> str:
+  if url.startswith("/tournaments/completed"):
+    return "tournament_list"
+  if "/standings" in url:
+    return "standings"
+  if url.endswith("/decklist"):
+    return "decklist"
+  if "/pairings" in url:
+    return "pairings"
+  path = urlsplit(url).path.rstrip("/")
+  if path == "/cards":
+    return "card_sets"
+  if path.startswith("/cards/"):
+    return "card_set" if path.count("/") == 2 else "card"
+  return "other"
+
+class Histogram:
+  def __init__(self):
+    self.samples = []
+
+  def add(self, value: float):
+    self.samples.append(value)
+
+  def percentile(self, p: float) -> float:
+    ordered = sorted(self.samples)
+    if not ordered:
+      return 0.0
+    return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+  def summary(self) -> dict:
+    if not self.samples:
+      return {"count": 0}
+    return {
+      "count": len(self.samples),
+      "total": round(sum(self.samples), 6),
+      "mean": round(sum(self.samples) / len(self.samples), 6),
+      "p50": round(self.percentile(50), 6),
+      "p90": round(self.percentile(90), 6),
+      "p99": round(self.percentile(99), 6),
+      "max": round(max(self.samples), 6),
+    }
+
+class CrawlMetrics:
+  def __init__(self, trace_path: str | None = None):
+    self.start = time.perf_counter()
+    self.cache_hits = defaultdict(int)
+    self.cache_misses = defaultdict(int)
+    self.bytes_from_network = defaultdict(int)
+    self.revalidated = defaultdict(int) # expired pages confirmed unchanged by a 304 response
+    self.retries = defaultdict(int)
+    self.errors = defaultdict(int) # pages that could not be fetched after every retry
+    self.fetch_latency = defaultdict(Histogram) # network request time, per page type
+    self.fetch_wait = defaultdict(Histogram) # time spent waiting for the request semaphore and the rate limiter
+    self.cache_latency = defaultdict(Histogram) # cache lookup time
+    self.parse_time = defaultdict(Histogram) # parsing time in the worker
+    self.parse_wait = defaultdict(Histogram) # time spent waiting for a free parsing worker
+    self.tournaments_written = 0
+    self.trace = open(trace_path, "w", encoding="utf-8") if trace_path else None
+
+  def event(self, kind: str, **fields):
+    if self.trace is not None:
+      fields["event"] = kind
+      fields["t"] = round(time.perf_counter() - self.start, 6)
+      self.trace.write(json.dumps(fields) + "\n")
+
+  def record_cache_hit(self, url: str, latency: float):
+    kind = page_type(url)
+    self.cache_hits[kind] += 1
+    self.cache_latency[kind].add(latency)
+    self.event("cache_hit", url=url, page_type=kind, latency=latency)
+
+  def record_fetch(self, url: str, cache_latency: float, wait: float, latency: float, nb_bytes: int, status: int,
+                   attempts: int = 1):
+    kind = page_type(url)
+    self.cache_misses[kind] += 1
+    self.cache_latency[kind].add(cache_latency)
+    self.fetch_wait[kind].add(wait)
+    self.fetch_latency[kind].add(latency)
+    self.bytes_from_network[kind] += nb_bytes
+    self.retries[kind] += attempts - 1
+    if status == 304:
+      self.revalidated[kind] += 1
+    self.event("fetch", url=url, page_type=kind, wait=wait, latency=latency, bytes=nb_bytes, status=status,
+               attempts=attempts)
+
+  def record_fetch_error(self, url: str, reason: str):
+    kind = page_type(url)
+    self.errors[kind] += 1
+    self.event("fetch_error", url=url, page_type=kind, reason=reason)
+
+  def record_parse(self, kind: str, wait: float, duration: float):
+    self.parse_wait[kind].add(wait)
+    self.parse_time[kind].add(duration)
+    self.event("parse", page_type=kind, wait=wait, duration=duration)
+
+  @property
+  def pages_from_cache(self) -> int:
+    return sum(self.cache_hits.values())
+
+  @property
+  def pages_from_network(self) -> int:
+    return sum(self.cache_misses.values())
+
+  def report(self) -> str:
+    elapsed = max(time.perf_counter() - self.start, 1e-9)
+    pages = self.pages_from_cache + self.pages_from_network
+    return (f"{pages} pages ({self.pages_from_network} from network, {self.pages_from_cache} from cache) "
+            f"in {elapsed:.1f}s: {pages / elapsed:.1f} pages/s, {self.tournaments_written} tournaments written, "
+            f"{sum(self.retries.values())} retries, {sum(self.errors.values())} errors")
+
+  def summary(self) -> dict:
+    elapsed = time.perf_counter() - self.start
+    kinds = sorted(set(self.cache_hits) | set(self.cache_misses) | set(self.errors) | set(self.parse_time))
+    per_type = {}
+    for kind in kinds:
+      hits = self.cache_hits[kind]
+      misses = self.cache_misses[kind]
+      per_type[kind] = {
+        "cache_hits": hits,
+        "cache_misses": misses,
+        "cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "bytes_from_network": self.bytes_from_network[kind],
+        "revalidated": self.revalidated[kind],
+        "retries": self.retries[kind],
+        "errors": self.errors[kind],
+        "fetch_latency": self.fetch_latency[kind].summary(),
+        "fetch_semaphore_wait": self.fetch_wait[kind].summary(),
+        "cache_latency": self.cache_latency[kind].summary(),
+        "parse_time": self.parse_time[kind].summary(),
+        "parse_pool_wait": self.parse_wait[kind].summary(),
+      }
+    pages = self.pages_from_cache + self.pages_from_network
+    return {
+      "elapsed": round(elapsed, 3),
+      "pages": pages,
+      "pages_per_second": round(pages / elapsed, 2) if elapsed > 0 else None,
+      "pages_from_network": self.pages_from_network,
+      "pages_from_cache": self.pages_from_cache,
+      "bytes_from_network": sum(self.bytes_from_network.values()),
+      "revalidated": sum(self.revalidated.values()),
+      "retries": sum(self.retries.values()),
+      "errors": sum(self.errors.values()),
+      "tournaments_written": self.tournaments_written,
+      "page_types": per_type,
+    }
+
+  def write_summary(self, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+      json.dump(self.summary(), f, indent=2)
+
+  def print_summary(self):
+    print(self.report())
+    print(f"{'page type':<16}{'hits':>8}{'misses':>8}{'MB':>8}{'fetch p50':>11}{'fetch p99':>11}{'wait p99':>10}{'parse p50':>11}{'parse p99':>11}")
+    for kind, stats in self.summary()["page_types"].items():
+      fetch = stats["fetch_latency"]
+      wait = stats["fetch_semaphore_wait"]
+      parse = stats["parse_time"]
+      print(f"{kind:<16}{stats['cache_hits']:>8}{stats['cache_misses']:>8}{stats['bytes_from_network'] / 1024 / 1024:>8.2f}"
+            f"{fetch.get('p50', 0) * 1000:>9.1f}ms{fetch.get('p99', 0) * 1000:>9.1f}ms{wait.get('p99', 0) * 1000:>8.1f}ms"
+            f"{parse.get('p50', 0) * 1000:>9.1f}ms{parse.get('p99', 0) * 1000:>9.1f}ms")
+
+  def close(self):
+    if self.trace is not None:
+      self.trace.close()
+      self.trace = None
@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import aiohttp
+import asyncio
+import random
+import time
+
+# Http layer of the scraper
+# - global cap on requests in flight
+# - per-host token bucket whose rate is halved on 429/5xx responses and slowly recovers afterwards
+# - request timeouts and bounded exponential-backoff retries (honouring Retry-After)
+# - conditional requests (If-None-Match / If-Modified-Since) to revalidate cached pages
+
+# Statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses meaning the page does not exist: retrying later will not help
+MISSING_STATUSES = {404, 410}
+
+# status: http status of the last response, None when the last attempt got no response
+class FetchError(Exception):
+  def __init__(self, url: str, reason: str, status: int | None = None):
+    super().__init__(f"{url}: {reason}")
+    self.url = url
+    self.reason = reason
+    self.status = status
+
+  @property
+  def missing(self) -> bool:
+    return self.status in MISSING_STATUSES
+
+@dataclass
+class FetchResult:
+  status: int
+  body: bytes
+  encoding: str
+  etag: str | None
+  last_modified: str | None
+  wait: float # time spent waiting for the concurrency cap and the rate limiter
+  latency: float # duration of the successful request
+  attempts: int
+
+  @property
+  def text(self) -> str:
+    return self.body.decode(self.encoding, errors="replace")
+
+class TokenBucket:
+  def __init__(self, max_rate: float, min_rate: float = 0.5):
+    self.max_rate = max_rate
+    self.min_rate = min(min_rate, max_rate)
+    self.rate = max_rate
+    self.tokens = 1.0
+    self.updated = time.monotonic()
+    self.blocked_until = 0.0
+    self.decreased_at = 0.0
+    self.lock = asyncio.Lock()
+
+  async def acquire(self):
+    async with self.lock:
+      while True:
+        now = time.monotonic()
+        if now < self.blocked_until:
+          await asyncio.sleep(self.blocked_until - now)
+          continue
+        # At most one second worth of burst
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate)
+
+  # Halve the rate when the server pushes back, then win it back by 5% per successful request
+  # Responses to requests sent at the old rate arrive together, so the rate is halved at most once per second
+  def throttled(self, retry_after: float | None = None):
+    now = time.monotonic()
+    if now - self.decreased_at >= 1:
+      self.rate = max(self.min_rate, self.rate / 2)
+      self.decreased_at = now
+    if retry_after:
+      self.blocked_until = max(self.blocked_until, now + retry_after)
+
+  def succeeded(self):
+    self.rate = min(self.max_rate, self.rate * 1.05)
+
+def parse_retry_after(value: str | None) -> float | None:
+  try:
+    return max(0.0, float(value)) if value is not None else None
+  except ValueError:
+    return None
+
+class HttpClient:
+  def __init__(
+      self,
+      session: aiohttp.ClientSession,
+      concurrency: int = 20,
+      max_rate: float = 20,
+      timeout: float = 30,
+      max_retries: int = 5,
+      backoff: float = 0.5,
+      max_backoff: float = 60,
+      proxy: str | None = None):
+    self.session = session
+    self.sem = asyncio.Semaphore(concurrency)
+    self.max_rate = max_rate
+    self.buckets = {}
+    self.timeout = aiohttp.ClientTimeout(total=timeout)
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.proxy = proxy
+    self.retries = 0
+    self.throttled = 0
+
+  def bucket(self, url: str) -> TokenBucket:
+    host = urlsplit(url).netloc
+    if host not in self.buckets:
+      self.buckets[host] = TokenBucket(self.max_rate)
+    return self.buckets[host]
+
+  def retry_delay(self, attempt: int, retry_after: float | None) -> float:
+    delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+    return max(delay, retry_after or 0)
+
+  # GET a url; etag / last_modified make the request conditional (a 304 result means "not modified")
+  # Raise FetchError when the page cannot be fetched, so error pages never end up in the cache
+  async def get(self, url: str, etag: str | None = None, last_modified: str | None = None) -> FetchResult:
+    headers = {}
+    if etag:
+      headers["If-None-Match"] = etag
+    if last_modified:
+      headers["If-Modified-Since"] = last_modified
+
+    bucket = self.bucket(url)
+    wait = 0.0
+    for attempt in range(self.max_retries + 1):
+      start = time.perf_counter()
+      async with self.sem:
+        await bucket.acquire()
+        wait += time.perf_counter() - start
+        start = time.perf_counter()
+        retry_after = None
+        status = None
+        try:
+          async with self.session.get(url, headers=headers, proxy=self.proxy, timeout=self.timeout) as resp:
+            status = resp.status
+            # The server wants us to slow down (429) or is struggling (any 5xx)
+            if resp.status == 429 or resp.status >= 500:
+              retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+              bucket.throttled(retry_after)
+              self.throttled += 1
+            if resp.status in RETRY_STATUSES:
+              reason = f"http {resp.status}"
+            elif resp.status >= 400:
+              raise FetchError(url, f"http {resp.status}", resp.status)
+            else:
+              body = await resp.read()
+              bucket.succeeded()
+              return FetchResult(
+                resp.status,
+                body,
+                resp.get_encoding() if body else "utf-8",
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified"),
+                wait,
+                time.perf_counter() - start,
+                attempt + 1
+              )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+          reason = repr(e)
+
+      if attempt == self.max_retries:
+        break
+      self.retries += 1
+      await asyncio.sleep(self.retry_delay(attempt, retry_after))
+
+    raise FetchError(url, f"{reason} after {self.max_retries + 1} attempts", status)
@@ -1,31 +1,37 @@
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer
 from dataclasses import dataclass, asdict
 import aiohttp
-import aiofile
+import argparse
 import asyncio
-import os
+import functools
 import json
+from concurrent.futures import Executor, ProcessPoolExecutor
+import os
 import re
+import sys
+import time
+
+from crawl_journal import CrawlJournal
+from crawl_metrics import CrawlMetrics
+from http_client import FetchError, HttpClient
+from page_cache import PageCache
+from tournament_store import TournamentRecord, TournamentStore
 
 base_url = "https://play.limitlesstcg.com"
 headers = {'User-Agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.106 Safari/537.36'}
 
-# Dataclasses used for json generation
-@dataclass
+# Items parsed from the decklist and pairings pages
+# Tournaments themselves are written as dicts, through a TournamentRecord (see tournament_store.py):
+#   {id, name, date, organizer, format, nb_players,
+#    players: [{id, name, placing, country, decklist: [{type, url, name, count}, ...]}, ...],
+#    matches: [{match_results: [{player_id, score}, ...]}, ...]}
+@dataclass(slots=True)
 class DeckListItem:
   type:str
   url: str
   name: str
   count: int
 
-@dataclass
-class Player:
-  id: str
-  name: str
-  placing: str
-  country: str
-  decklist: list[DeckListItem]
-
 @dataclass
 class MatchResult:
   player_id: str
@@ -35,17 +41,6 @@ class MatchResult:
 class Match:
   match_results: list[MatchResult]
 
-@dataclass
-class Tournament:
-  id: str
-  name: str
-  date: str
-  organizer: str
-  format: str
-  nb_players: str
-  players: list[Player]
-  matches:list[Match]
-
 # Extract the tr tags from a table, omiting the first header
 def extract_trs(soup: BeautifulSoup, table_class: str):
   trs = soup.find(class_=table_class).find_all("tr")
@@ -156,186 +151,536 @@ def extract_decklist(decklist: BeautifulSoup) -> list[DeckListItem]:
 
   return cards
 
-# Extract a beautiful soup object from a url
-async def async_soup_from_url(session: aiohttp.ClientSession, sem: asyncio.Semaphore, url: str, use_cache: bool = True):
+# State shared by every task of a crawl
+@dataclass
+class CrawlContext:
+  client: HttpClient # Rate limited http requests with retries (see http_client.py)
+  cache: PageCache
+  store: TournamentStore
+  metrics: CrawlMetrics
+  parse_pool: Executor | None = None # Pages are parsed in this pool, or on the event loop if None
+  parser: str = "html.parser" # BeautifulSoup tree builder: html.parser, lxml or html5lib
+  list_page_ttl: float = 3600 # Tournament list pages change as tournaments complete
+  journal: CrawlJournal | None = None # Progress of the crawl, to resume it after a crash (see crawl_journal.py)
+  decklist_window: int = 8 # decklist pages of a tournament fetched at the same time
+
+  def set_state(self, tournament_id: str, state: str, reason: str | None = None):
+    if self.journal is not None:
+      self.journal.set_state(tournament_id, state, reason)
+
+  # Run a parse_* function on a page without blocking the event loop
+  async def parse(self, parse_function, html: str, *args):
+    start = time.perf_counter()
+    if self.parse_pool is None:
+      result, duration = timed_parse(parse_function, html, self.parser, *args)
+    else:
+      loop = asyncio.get_running_loop()
+      result, duration = await loop.run_in_executor(self.parse_pool, timed_parse, parse_function, html, self.parser, *args)
+    kind = parse_function.__name__.removeprefix("parse_").removesuffix("_page")
+    self.metrics.record_parse(kind, time.perf_counter() - start - duration, duration)
+    return result
+
+# Run a parse_* function and measure its duration where it runs (in the worker process)
+def timed_parse(parse_function, html: str, parser: str, *args):
+  start = time.perf_counter()
+  result = parse_function(html, parser, *args)
+  return result, time.perf_counter() - start
+
+# Get the html of a url, from the cache if possible
+# ttl: lifetime in the cache in seconds, None to cache the page forever (completed tournaments never change)
+# An expired page is revalidated with a conditional request, and reused as is if the server answers 304
+async def async_html_from_url(ctx: CrawlContext, url: str, use_cache: bool = True, ttl: float | None = None):
   
   if url is None:
     return None
-  
-  # Construct cache filename
-  cache_filename = "cache" + url
-  cache_filename = ''.join(x for x in cache_filename if (x == "/" or x.isalnum()))
-  cache_filename = f"{cache_filename}.html"
-  
-  html = ""
-
-  if use_cache and os.path.isfile(cache_filename):
-    # print(f"url {url} is in cache")
-    async with sem:
-      async with aiofile.async_open(cache_filename, "r") as file:
-        html = await file.read()
-  else:
-    # print(f"url {url} is not in cache, requesting from source")
-    async with session.get(url, proxy='http://ocytohe.univ-ubs.fr:3128') as resp:
-      html = await resp.text()
-
-    directory = os.path.dirname(cache_filename)
-    if not os.path.exists(directory):
-      os.makedirs(directory)
-    
-    async with sem:
-      async with aiofile.async_open(cache_filename, "w") as file:
-        await file.write(html)
 
-  return BeautifulSoup(html, 'html.parser')
+  start = time.perf_counter()
+  entry = None
+  if use_cache:
+    entry = await ctx.cache.alookup(url, ttl)
+    if entry is not None and entry.fresh:
+      ctx.metrics.record_cache_hit(url, time.perf_counter() - start)
+      return entry.html
+  cache_latency = time.perf_counter() - start
+
+  try:
+    if entry is not None:
+      response = await ctx.client.get(url, entry.etag, entry.last_modified)
+    else:
+      response = await ctx.client.get(url)
+  except FetchError as e:
+    ctx.metrics.record_fetch_error(url, e.reason)
+    raise
+  ctx.metrics.record_fetch(url, cache_latency, response.wait, response.latency, len(response.body), response.status,
+                           response.attempts)
 
-async def extract_players(
-  session: aiohttp.ClientSession,
-  sem: asyncio.Semaphore,
-  standings_page: BeautifulSoup,
-  tournament_id: str) -> list[Player]:
-
-  players = []
-  player_trs = extract_trs(standings_page, "striped")
-  player_ids = [player_tr.find("a", {'href': regex_player_id}).attrs["href"].split('/')[4] for player_tr in player_trs]
-  has_decklist = [player_tr.find("a", {'href': regex_decklist_url}) is not None for player_tr in player_trs]
-  player_names=[player_tr.attrs['data-name'] for player_tr in player_trs]
-  player_placings=[player_tr.attrs.get("data-placing", -1) for player_tr in player_trs]
-  player_countries=[player_tr.attrs.get("data-country", None) for player_tr in player_trs]
-
-  decklist_urls = []
-  for i in range(len(player_ids)):
-    decklist_urls.append(construct_decklist_url(tournament_id, player_ids[i]) if has_decklist[i] else None)
-
-  player_decklists = await asyncio.gather(*[async_soup_from_url(session, sem, url, True) for url in decklist_urls])
-
-  players = []
-  for i in range(len(player_ids)):
-    if player_decklists[i] is None:
-      continue
+  if response.status == 304 and entry is not None:
+    await ctx.cache.arefresh(url, ttl)
+    return entry.html
 
-    players.append(Player(
-      player_ids[i],
-      player_names[i],
-      player_placings[i],
-      player_countries[i],
-      extract_decklist(player_decklists[i])
-    ))
+  html = response.text
+  await ctx.cache.aput(url, html, ttl, response.etag, response.last_modified)
 
-  return players
+  return html
 
-async def extract_matches(
-  session: aiohttp.ClientSession,
-  sem: asyncio.Semaphore,
-  tournament_id: str) -> list[Match]:
+# A row of the standings table
+@dataclass(slots=True)
+class StandingsRow:
+  id: str
+  name: str
+  placing: str
+  country: str
+  has_decklist: bool
 
-  matches = []
-  last_pairings = await async_soup_from_url(session, sem, construct_pairings_url(tournament_id))
-  previous_pairings_urls = extract_previous_pairings_urls(last_pairings)
-  pairings = await asyncio.gather(*[async_soup_from_url(session, sem, url) for url in previous_pairings_urls])
-  pairings.append(last_pairings)
+# A row of the completed tournaments list
+@dataclass
+class TournamentListing:
+  id: str
+  name: str
+  date: str
+  organizer: str
+  format: str
+  nb_players: str
+
+# Targeted parsing: each page type only builds the elements its extractor reads
+# The html before the first occurrence of their class names (head, navigation...) is not even tokenized: any
+# element with one of these classes has the name in its start tag, so the cut is never after it. A SoupStrainer
+# then keeps only the matching elements and their subtrees. Pages without any of the names are parsed whole,
+# through the same strainer.
+# The strainer sees the raw class attribute ("table striped"), hence the split: an element matches as soon as one
+# of its classes does, like find(class_=...).
+STANDINGS_PARTS = ("striped",)
+DECKLIST_PARTS = ("decklist",)
+PAIRINGS_PARTS = ("mini-nav", "live-bracket", "pairings")
+TOURNAMENT_LIST_PARTS = ("pagination", "completed-tournaments")
+
+@functools.cache
+def class_strainer(classes: tuple[str, ...]) -> SoupStrainer:
+  wanted = frozenset(classes)
+  return SoupStrainer(class_=lambda value: value is not None and not wanted.isdisjoint(value.split()))
+
+def parse_parts(html: str, parser: str, classes: tuple[str, ...]) -> BeautifulSoup:
+  starts = [index for index in (html.find(name) for name in classes) if index >= 0]
+  if starts:
+    html = html[max(html.rfind("<", 0, min(starts)), 0):]
+  return BeautifulSoup(html, parser, parse_only=class_strainer(classes))
+
+# Page parsers
+# They take the raw html and return plain dataclasses, so they can run in a worker process
+# Trees are decomposed once the records are extracted, instead of waiting for the garbage collector
+
+# Single pass over the rows: the links of each row are read once, until both the player and the decklist are found
+def parse_standings_page(html: str, parser: str) -> list[StandingsRow]:
+  standings_page = parse_parts(html, parser, STANDINGS_PARTS)
+  try:
+    rows = []
+    for player_tr in extract_trs(standings_page, "striped"):
+      player_id, has_decklist = None, False
+      for link in player_tr.find_all("a", href=True):
+        href = link.attrs["href"]
+        if player_id is None and regex_player_id.search(href):
+          player_id = href.split('/')[4]
+        if regex_decklist_url.search(href):
+          has_decklist = True
+        if player_id is not None and has_decklist:
+          break
+      if player_id is None:
+        raise Exception("Standings row without player link")
+      rows.append(StandingsRow(player_id, player_tr.attrs['data-name'], player_tr.attrs.get("data-placing", -1),
+                               player_tr.attrs.get("data-country", None), has_decklist))
+  finally:
+    standings_page.decompose()
+
+  return rows
+
+def parse_decklist_page(html: str, parser: str) -> list[DeckListItem]:
+  decklist_page = parse_parts(html, parser, DECKLIST_PARTS)
+  try:
+    return extract_decklist(decklist_page)
+  finally:
+    decklist_page.decompose()
+
+# Return the urls of the previous rounds and the matches of a pairings page
+def parse_pairings_page(html: str, parser: str) -> tuple[list[str], list[Match]]:
+  pairing = parse_parts(html, parser, PAIRINGS_PARTS)
+  try:
+    previous_pairings_urls = extract_previous_pairings_urls(pairing)
 
-  for pairing in pairings:
     if is_bracket_pairing(pairing):
-      matches = matches + extract_matches_from_bracket_pairings(pairing)
+      matches = extract_matches_from_bracket_pairings(pairing)
     elif is_table_pairing(pairing):
-      matches = matches + extract_matches_from_table_pairings(pairing)
+      matches = extract_matches_from_table_pairings(pairing)
     else:
       raise Exception("Unrecognized pairing type")
+  finally:
+    pairing.decompose()
+
+  return previous_pairings_urls, matches
+
+# Return the current page, the last page and the tournaments of a completed tournaments list page
+def parse_tournament_list_page(html: str, parser: str) -> tuple[int, int, list[TournamentListing]]:
+  soup = parse_parts(html, parser, TOURNAMENT_LIST_PARTS)
+  try:
+    current_page = int(soup.find("ul", class_="pagination").attrs["data-current"])
+    max_page = int(soup.find("ul", class_="pagination").attrs["data-max"])
+
+    listings = []
+    for tournament_tr in extract_trs(soup, "completed-tournaments"):
+      listings.append(TournamentListing(
+        tournament_tr.find("a", {'href': regex_standings_url}).attrs["href"].split('/')[2],
+        tournament_tr.attrs['data-name'],
+        tournament_tr.attrs['data-date'],
+        tournament_tr.attrs['data-organizer'],
+        tournament_tr.attrs['data-format'],
+        tournament_tr.attrs['data-players']
+      ))
+  finally:
+    soup.decompose()
+
+  return current_page, max_page, listings
+
+# A decklist page that does not exist (404) is an empty decklist; any other error fails the tournament
+async def fetch_decklist(ctx: CrawlContext, url: str) -> list[DeckListItem]:
+  try:
+    html = await async_html_from_url(ctx, url, True)
+  except FetchError as e:
+    if e.missing:
+      return []
+    raise
+  return await ctx.parse(parse_decklist_page, html)
+
+# Fetch the decklists of the players who published one and add them to the record as they arrive
+# At most ctx.decklist_window pages of the tournament are in flight: the fetchers share the iterator of rows
+# Return the number of players
+async def extract_players(
+  ctx: CrawlContext,
+  standings: list[StandingsRow],
+  record: TournamentRecord) -> int:
+
+  players_with_decklist = [row for row in standings if row.has_decklist]
+  rows = enumerate(players_with_decklist)
+
+  async def fetch_players():
+    for slot, row in rows:
+      decklist = await fetch_decklist(ctx, construct_decklist_url(record.tournament_id, row.id))
+      record.add_player(slot, row.id, row.name, row.placing, row.country,
+                        [(card.type, card.url, card.name, card.count) for card in decklist])
+
+  fetchers = [asyncio.create_task(fetch_players()) for _ in range(min(ctx.decklist_window, len(players_with_decklist)))]
+  try:
+    await asyncio.gather(*fetchers)
+  finally:
+    # A failed page fails the tournament: stop fetching the others
+    for fetcher in fetchers:
+      fetcher.cancel()
+    await asyncio.gather(*fetchers, return_exceptions=True)
+
+  return len(players_with_decklist)
+
+async def fetch_pairings(ctx: CrawlContext, url: str) -> tuple[list[str], list[Match]]:
+  html = await async_html_from_url(ctx, url)
+  return await ctx.parse(parse_pairings_page, html)
+
+async def extract_matches(
+  ctx: CrawlContext,
+  tournament_id: str) -> list[Match]:
+
+  previous_pairings_urls, last_matches = await fetch_pairings(ctx, construct_pairings_url(tournament_id))
+  pairings = await asyncio.gather(*[fetch_pairings(ctx, url) for url in previous_pairings_urls])
+
+  matches = []
+  for _, round_matches in pairings:
+    matches = matches + round_matches
+  matches = matches + last_matches
     
   return matches
 
 regex_player_id = re.compile(r'/tournament/[a-zA-Z0-9_\-]*/player/[a-zA-Z0-9_]*')
 regex_decklist_url = re.compile(r'/tournament/[a-zA-Z0-9_\-]*/player/[a-zA-Z0-9_]*/decklist')
-async def handle_tournament_standings_page(
-    session: aiohttp.ClientSession,
-    sem: asyncio.Semaphore,
-    standings_page: BeautifulSoup,
-    tournament_id: str, 
-    tournament_name: str,
-    tournament_date: str,
-    tournament_organizer: str,
-    tournament_format: str,
-    tournament_nb_players: int):
-  
-  output_file = f"output/{tournament_id}.json"
-  
-  print(f"extracting tournament {tournament_id}", end="... ")
+async def handle_tournament_standings_page(ctx: CrawlContext, listing: TournamentListing):
 
-  # If the json file for this tournament already exists, we don't recreate it
-  if os.path.isfile(output_file):
-    print("skipping because tournament is already in output")
+  # If this tournament is already in the store (or in a legacy json file), we don't recreate it
+  # nor fetch any of its pages
+  if listing.id in ctx.store or os.path.isfile(f"output/{listing.id}.json"):
+    print(f"tournament {listing.id}: skipping because tournament is already in output")
+    ctx.set_state(listing.id, "skipped", "already in output")
     return
-  else:
-    directory = os.path.dirname(output_file)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-  players = await extract_players(session, sem, standings_page, tournament_id)
-  if len(players) == 0:
-    print("skipping because no decklist was detected")
+
+  standings_html = await async_html_from_url(ctx, construct_standings_url(listing.id))
+  standings = await ctx.parse(parse_standings_page, standings_html)
+  ctx.set_state(listing.id, "standings")
+
+  # Players and matches go straight into the compact record written to the store (see tournament_store.py)
+  record = TournamentRecord(asdict(listing))
+  nb_players = await extract_players(ctx, standings, record)
+  del standings
+  if nb_players == 0:
+    print(f"tournament {listing.id}: skipping because no decklist was detected")
+    ctx.set_state(listing.id, "skipped", "no decklist")
     return
+  ctx.set_state(listing.id, "decklists")
   
-  nb_decklists = 0
-  for player in players:
-    if len(player.decklist) > 0:
-      nb_decklists += 1
-  
-  matches = await extract_matches(session, sem, tournament_id)
-
-  tournament = Tournament(
-    tournament_id,
-    tournament_name,
-    tournament_date,
-    tournament_organizer,
-    tournament_format,
-    tournament_nb_players,
-    players,
-    matches
-  )
-
-  print(f"{len(players)} players, {nb_decklists} decklists, {len(matches)} matches")
+  matches = await extract_matches(ctx, listing.id)
+  for match in matches:
+    record.add_match((result.player_id, result.score) for result in match.match_results)
+  ctx.set_state(listing.id, "pairings")
+
+  print(f"tournament {listing.id}: {nb_players} players, {record.nb_decklists} decklists, {len(matches)} matches")
   
-  with open(output_file, "w") as f:
-    json.dump(asdict(tournament), f, indent=2)
+  ctx.store.append_record(record)
+  ctx.metrics.tournaments_written += 1
+  ctx.set_state(listing.id, "written")
 
 first_tournament_page = "/tournaments/completed?game=POCKET&format=STANDARD&platform=all&type=online&time=all"
 regex_standings_url = re.compile(r'/tournament/[a-zA-Z0-9_\-]*/standings')
-async def handle_tournament_list_page(session: aiohttp.ClientSession, sem: asyncio.Semaphore, url: str):
-  soup = await async_soup_from_url(session, sem, url, False)
-  
-  current_page = int(soup.find("ul", class_="pagination").attrs["data-current"])
-  max_page = int(soup.find("ul", class_="pagination").attrs["data-max"])
-  
-  print(f"extracting completed tournaments page {current_page}")
-
-  tournament_trs = extract_trs(soup, "completed-tournaments")
-  tournament_ids = [tournament_tr.find("a", {'href': regex_standings_url}).attrs["href"].split('/')[2] for tournament_tr in tournament_trs]
-  tournament_names=[tournament_tr.attrs['data-name']for tournament_tr in tournament_trs]
-  tournament_dates=[tournament_tr.attrs['data-date']for tournament_tr in tournament_trs]
-  tournament_organizers=[tournament_tr.attrs['data-organizer']for tournament_tr in tournament_trs]
-  tournament_formats=[tournament_tr.attrs['data-format']for tournament_tr in tournament_trs]
-  tournament_nb_players=[tournament_tr.attrs['data-players']for tournament_tr in tournament_trs]
-  
-  standings_urls = [construct_standings_url(tournament_id) for tournament_id in tournament_ids]
-  
-  # Get all standings page asynchroneously
-  standings = await asyncio.gather(*[async_soup_from_url(session, sem, url) for url in standings_urls])
-
-  for i in range(len(tournament_ids)):
-    await handle_tournament_standings_page(session, sem, standings[i], tournament_ids[i], tournament_names[i], tournament_dates[i], tournament_organizers[i], tournament_formats[i], tournament_nb_players[i])
 
-  if current_page < max_page:
-    await handle_tournament_list_page(session, sem, f"{first_tournament_page}&page={current_page+1}")
-
-async def main():
+# Watermark of the incremental crawl: the newest completed tournament of the last successful crawl
+# Every tournament listed after it (i.e. older) has already been handled
+def load_watermark(path: str) -> dict | None:
+  if not os.path.isfile(path):
+    return None
+  with open(path, encoding="utf-8") as f:
+    return json.load(f)
+
+def save_watermark(path: str, listing: TournamentListing):
+  directory = os.path.dirname(path)
+  if directory and not os.path.exists(directory):
+    os.makedirs(directory)
+  with open(path + ".tmp", "w", encoding="utf-8") as f:
+    json.dump({"id": listing.id, "date": listing.date}, f)
+  os.replace(path + ".tmp", path)
+
+# True once the list pages reach tournaments older than the watermark
+def reached_watermark(listing: TournamentListing, watermark: dict | None) -> bool:
+  return watermark is not None and (listing.id == watermark["id"] or listing.date < watermark["date"])
+
+# Producer: walk the list pages and queue every tournament, newest first
+# The queue is bounded, so list pages are only fetched as fast as tournaments are consumed
+# With a watermark (incremental crawl), paging stops at the first tournament already seen by a previous crawl,
+# or after a list page whose tournaments are all in the store
+# With a journal, the tournaments left unfinished by a previous run are queued first, paging resumes at the
+# first list page that was not fully queued, and finished tournaments are not queued again
+# Return the newest listed tournament
+async def produce_tournament_listings(ctx: CrawlContext, queue: asyncio.Queue, watermark: dict | None = None,
+                                      incremental: bool = False, resume: bool = True,
+                                      max_attempts: int = 3) -> TournamentListing | None:
+  page = 1
+  newest = None
+  queued = set()
+  if ctx.journal is not None:
+    page = ctx.journal.begin(resume)
+    if page > 1:
+      print(f"resuming the previous crawl at list page {page}")
+    if ctx.journal.get("newest") is not None:
+      newest = TournamentListing(**ctx.journal.get("newest"))
+    for listing in ctx.journal.pending(max_attempts):
+      queued.add(listing["id"])
+      await queue.put(TournamentListing(**listing))
+    if queued:
+      print(f"{len(queued)} unfinished tournaments queued from the journal")
+
+  while True:
+    url = first_tournament_page if page == 1 else f"{first_tournament_page}&page={page}"
+    html = await async_html_from_url(ctx, url, ttl=ctx.list_page_ttl)
+    current_page, max_page, listings = await ctx.parse(parse_tournament_list_page, html)
+    print(f"extracting completed tournaments page {current_page}/{max_page}")
+
+    if current_page == 1 and listings:
+      newest = listings[0]
+      if ctx.journal is not None:
+        ctx.journal.set("newest", asdict(newest))
+
+    stop = False
+    for index, listing in enumerate(listings):
+      if reached_watermark(listing, watermark):
+        print(f"tournament {listing.id}: reached the watermark of the previous crawl, stopping")
+        listings = listings[:index]
+        stop = True
+        break
+
+    todo = listings
+    if ctx.journal is not None and listings:
+      todo = [TournamentListing(**listing) for listing in ctx.journal.add_listings([asdict(l) for l in listings], max_attempts)]
+    for listing in todo:
+      if listing.id not in queued:
+        queued.add(listing.id)
+        await queue.put(listing)
+    if ctx.journal is not None:
+      ctx.journal.page_done(current_page)
+
+    if not stop and incremental and listings and all(listing.id in ctx.store for listing in listings):
+      print(f"every tournament of page {current_page} is already in output, stopping")
+      stop = True
+
+    if stop or current_page >= max_page:
+      return newest
+    page = current_page + 1
+
+# Consumer: handle queued tournaments one after the other
+# Several consumers run at once, each one with its standings, decklists and pairings in flight
+async def consume_tournament_listings(ctx: CrawlContext, queue: asyncio.Queue, errors: list):
+  while True:
+    listing = await queue.get()
+    try:
+      await handle_tournament_standings_page(ctx, listing)
+    except Exception as e:
+      print(f"tournament {listing.id}: failed ({e!r})")
+      ctx.set_state(listing.id, "failed", repr(e))
+      errors.append(e)
+    finally:
+      queue.task_done()
+
+# Crawl the completed tournaments; watermark_path is updated once every listed tournament has been handled
+# A failed tournament does not stop the crawl, return the number of failures
+async def crawl(ctx: CrawlContext, nb_workers: int, incremental: bool = False, watermark_path: str | None = None,
+                resume: bool = True, max_attempts: int = 3) -> int:
+  watermark = load_watermark(watermark_path) if incremental and watermark_path else None
+  if watermark is not None:
+    print(f"incremental crawl: stopping at tournament {watermark['id']} ({watermark['date']})")
+
+  queue = asyncio.Queue(maxsize=nb_workers * 2)
+  errors = []
+  consumers = [asyncio.create_task(consume_tournament_listings(ctx, queue, errors)) for _ in range(nb_workers)]
+  try:
+    newest = await produce_tournament_listings(ctx, queue, watermark, incremental, resume, max_attempts)
+    await queue.join()
+    if ctx.journal is not None:
+      ctx.journal.finish()
+    # Without a journal, a failed tournament must be listed again by the next crawl, so the watermark only
+    # moves after a clean run; with a journal, failed tournaments are queued again from the journal
+    if newest is not None and watermark_path and (ctx.journal is not None or not errors):
+      save_watermark(watermark_path, newest)
+  finally:
+    for consumer in consumers:
+      consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    ctx.metrics.print_summary()
+
+  if errors:
+    print(f"{len(errors)} tournaments failed, run the crawl again to retry them")
+  if ctx.journal is not None:
+    for tournament_id, reason, attempts in ctx.journal.failures():
+      if attempts >= max_attempts:
+        print(f"tournament {tournament_id}: gave up after {attempts} attempts ({reason})")
+  return len(errors)
+
+# Options of a crawl
+@dataclass
+class CrawlConfig:
+  base_url: str = base_url # site to crawl, a local stand-in for the benchmarks (see benchmarks/)
+  concurrency: int = 20 # maximum number of http requests in flight
+  max_rate: float = 20 # requests per second and per host, lowered when the server answers 429/5xx
+  timeout: float = 30 # seconds, for a whole request
+  retries: int = 5 # retries of a failed request, with exponential backoff
+  proxy: str | None = "http://ocytohe.univ-ubs.fr:3128"
+  workers: int = 8 # number of tournaments processed at the same time
+  decklist_window: int = 8 # decklist pages of a tournament fetched at the same time
+  parse_workers: int = 0 # html parsing processes, 0 = one per core, -1 = parse on the event loop
+  parser: str = "html.parser"
+  cache_path: str = "cache/pages.sqlite"
+  cache_max_mb: float | None = None
+  list_page_ttl: float = 3600
+  incremental: bool = False # stop at the tournaments handled by the previous crawl
+  watermark_path: str = "output/watermark.json"
+  journal_path: str | None = "output/crawl_journal.sqlite" # None to crawl without a journal
+  resume: bool = True # resume the crawl left unfinished by the previous run
+  max_attempts: int = 3 # a tournament that failed this many times is no longer retried
+  metrics_path: str | None = "crawl_metrics.json"
+  trace_path: str | None = None
+
+# Return the number of tournaments that failed
+async def main(config: CrawlConfig) -> int:
   # Limit number of concurent http calls
-  connector = aiohttp.TCPConnector(limit=20)
-
-  # Limit number of concurent open files
-  sem = asyncio.Semaphore(50)
-
-  async with aiohttp.ClientSession(base_url=base_url, connector=connector) as session:
-    await handle_tournament_list_page(session, sem, first_tournament_page)
-    
-asyncio.run(main())
\ No newline at end of file
+  connector = aiohttp.TCPConnector(limit=config.concurrency)
+
+  # Compressed html cache (see page_cache.py), pages from the previous cache/ layout are imported on demand
+  cache = PageCache(config.cache_path)
+  removed = cache.evict(int(config.cache_max_mb * 1024 * 1024) if config.cache_max_mb else None)
+  entries, size = cache.stats()
+  print(f"cache: {entries} pages, {size / 1024 / 1024:.1f} MB ({removed} evicted)")
+
+  # Tournaments are appended to a single compact file (see tournament_store.py)
+  store = TournamentStore()
+
+  # Html parsing runs in worker processes, so the event loop keeps fetching while pages are parsed
+  parse_pool = ProcessPoolExecutor(config.parse_workers or os.cpu_count()) if config.parse_workers >= 0 else None
+
+  metrics = CrawlMetrics(config.trace_path)
+
+  # Per-tournament progress, so an interrupted crawl resumes where it stopped (see crawl_journal.py)
+  journal = CrawlJournal(config.journal_path) if config.journal_path else None
+
+  try:
+    async with aiohttp.ClientSession(base_url=config.base_url, connector=connector, headers=headers) as session:
+      client = HttpClient(session, config.concurrency, config.max_rate, config.timeout, config.retries, proxy=config.proxy)
+      ctx = CrawlContext(client, cache, store, metrics, parse_pool, config.parser, config.list_page_ttl, journal,
+                         config.decklist_window)
+      return await crawl(ctx, config.workers, config.incremental, config.watermark_path,
+                         config.resume, config.max_attempts)
+  finally:
+    if parse_pool is not None:
+      parse_pool.shutdown(cancel_futures=True)
+    cache.close()
+    if journal is not None:
+      journal.close()
+    metrics.close()
+    if config.metrics_path:
+      metrics.write_summary(config.metrics_path)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Scrape completed Pokémon TCG Pocket tournaments from Limitless TCG")
+  parser.add_argument("--base-url", default=base_url, help="site to crawl (default: %(default)s)")
+  parser.add_argument("--concurrency", type=int, default=20, help="maximum number of http requests in flight")
+  parser.add_argument("--max-rate", type=float, default=20,
+                      help="maximum requests per second to the site, automatically lowered when it throttles")
+  parser.add_argument("--timeout", type=float, default=30, help="timeout of an http request, in seconds")
+  parser.add_argument("--retries", type=int, default=5, help="retries of a failed http request")
+  proxy = parser.add_mutually_exclusive_group()
+  proxy.add_argument("--proxy", default=CrawlConfig.proxy, help="http proxy (default: %(default)s)")
+  proxy.add_argument("--no-proxy", dest="proxy", action="store_const", const=None, help="connect directly")
+  parser.add_argument("--workers", type=int, default=8, help="number of tournaments processed at the same time")
+  parser.add_argument("--decklist-window", type=int, default=8,
+                      help="decklist pages of a tournament fetched at the same time")
+  parser.add_argument("--parse-workers", type=int, default=0,
+                      help="number of html parsing processes (0 = one per core, -1 = parse on the event loop)")
+  parser.add_argument("--parser", default="html.parser", choices=["html.parser", "lxml", "html5lib"],
+                      help="BeautifulSoup parser backend (lxml is the fastest, if installed)")
+  parser.add_argument("--cache", default="cache/pages.sqlite", help="path of the html cache database")
+  parser.add_argument("--cache-max-mb", type=float, default=None,
+                      help="evict least recently used pages beyond this compressed size")
+  parser.add_argument("--list-ttl", type=float, default=3600,
+                      help="seconds a tournament list page stays in the cache")
+  parser.add_argument("--incremental", action="store_true",
+                      help="only crawl the tournaments completed since the last successful crawl")
+  parser.add_argument("--journal", default="output/crawl_journal.sqlite",
+                      help="crawl journal used to resume an interrupted crawl")
+  parser.add_argument("--no-resume", dest="resume", action="store_false",
+                      help="start a new crawl from the first list page even if the previous one did not finish")
+  parser.add_argument("--max-attempts", type=int, default=3,
+                      help="number of attempts before giving up on a failing tournament")
+  parser.add_argument("--metrics", default="crawl_metrics.json",
+                      help="where to write the json summary of cache, fetch and parse metrics")
+  parser.add_argument("--trace", default=None, help="optional json-lines trace of every fetch and parse")
+  args = parser.parse_args()
+  failed = asyncio.run(main(CrawlConfig(
+    base_url=args.base_url,
+    concurrency=args.concurrency,
+    max_rate=args.max_rate,
+    timeout=args.timeout,
+    retries=args.retries,
+    proxy=args.proxy,
+    workers=args.workers,
+    decklist_window=args.decklist_window,
+    parse_workers=args.parse_workers,
+    parser=args.parser,
+    cache_path=args.cache,
+    cache_max_mb=args.cache_max_mb,
+    list_page_ttl=args.list_ttl,
+    incremental=args.incremental,
+    journal_path=args.journal,
+    resume=args.resume,
+    max_attempts=args.max_attempts,
+    metrics_path=args.metrics,
+    trace_path=args.trace,
+  )))
+  sys.exit(1 if failed else 0)
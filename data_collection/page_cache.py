@@ -0,0 +1,213 @@
+from collections import namedtuple
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# Html cache of the scraper, stored in a single SQLite file
+#
+# entries: one row per url (the url itself is the key, so two urls can never collide), with the
+# fetch time, an optional expiry time (NULL = kept forever), the last access time used for eviction and
+# the ETag / Last-Modified validators sent by the server, used to revalidate the page once it has expired
+# blobs: compressed page bodies addressed by the sha256 of the html, shared by urls with identical content
+#
+# Pages are compressed with zstd when the zstandard package is installed, zlib otherwise; the codec is
+# stored with each blob so a cache written with one codec stays readable with the other.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+  digest TEXT PRIMARY KEY,
+  codec TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+  url TEXT PRIMARY KEY,
+  digest TEXT NOT NULL REFERENCES blobs(digest),
+  fetched_at REAL NOT NULL,
+  expires_at REAL,
+  last_access REAL NOT NULL,
+  etag TEXT,
+  last_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries(digest);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+"""
+
+# Columns added after the first version of the schema, created on older cache files
+MIGRATIONS = {
+  "etag": "ALTER TABLE entries ADD COLUMN etag TEXT",
+  "last_modified": "ALTER TABLE entries ADD COLUMN last_modified TEXT",
+}
+
+# A cached page; fresh is False once the entry has expired and must be revalidated
+CacheEntry = namedtuple("CacheEntry", "html fresh etag last_modified")
+
+def compress(html: str) -> tuple[str, bytes]:
+  data = html.encode("utf-8")
+  if zstandard is not None:
+    return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+  return "zlib", zlib.compress(data, 6)
+
+def decompress(codec: str, body: bytes) -> str:
+  if codec == "zstd":
+    if zstandard is None:
+      raise RuntimeError("this cache entry is zstd-compressed, install the zstandard package to read it")
+    return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+  return zlib.decompress(body).decode("utf-8")
+
+# Path of a page in the previous cache layout (one loose html file per url)
+def legacy_cache_filename(legacy_directory: str, url: str) -> str:
+  cache_filename = legacy_directory + url
+  cache_filename = ''.join(x for x in cache_filename if (x == "/" or x.isalnum()))
+  return f"{cache_filename}.html"
+
+class PageCache:
+  def __init__(self, path: str = "cache/pages.sqlite", legacy_directory: str | None = "cache"):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    self.path = path
+    self.legacy_directory = legacy_directory
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+    self.db.executescript(SCHEMA)
+    columns = {row[1] for row in self.db.execute("PRAGMA table_info(entries)")}
+    for column, statement in MIGRATIONS.items():
+      if column not in columns:
+        self.db.execute(statement)
+    self.db.commit()
+
+  def close(self):
+    with self.lock:
+      self.db.close()
+
+  # Return the cached entry of a url, expired or not, or None if the url is not cached
+  # ttl: lifetime the caller gives this url, applied to a page imported from the previous cache layout
+  def lookup(self, url: str, ttl: float | None = None) -> CacheEntry | None:
+    now = time.time()
+    with self.lock:
+      row = self.db.execute(
+        "SELECT e.expires_at, e.etag, e.last_modified, b.codec, b.body FROM entries e "
+        "JOIN blobs b ON b.digest = e.digest WHERE e.url = ?",
+        (url,)
+      ).fetchone()
+      if row is not None:
+        self.db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (now, url))
+        self.db.commit()
+    if row is None:
+      return self._get_legacy(url, ttl)
+    return CacheEntry(decompress(row[3], row[4]), row[0] is None or row[0] > now, row[1], row[2])
+
+  # Return the cached html of a url, or None if it is missing or expired
+  def get(self, url: str, ttl: float | None = None) -> str | None:
+    entry = self.lookup(url, ttl)
+    return entry.html if entry is not None and entry.fresh else None
+
+  # Store the html of a url; ttl is in seconds, None to keep it forever
+  def put(self, url: str, html: str, ttl: float | None = None, etag: str | None = None, last_modified: str | None = None):
+    now = time.time()
+    digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    codec, body = compress(html)
+    with self.lock:
+      previous = self.db.execute("SELECT digest FROM entries WHERE url = ?", (url,)).fetchone()
+      self.db.execute(
+        "INSERT OR IGNORE INTO blobs (digest, codec, size, body) VALUES (?, ?, ?, ?)",
+        (digest, codec, len(body), body)
+      )
+      self.db.execute(
+        "INSERT OR REPLACE INTO entries (url, digest, fetched_at, expires_at, last_access, etag, last_modified) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (url, digest, now, now + ttl if ttl is not None else None, now, etag, last_modified)
+      )
+      if previous is not None and previous[0] != digest:
+        self.db.execute(
+          "DELETE FROM blobs WHERE digest = ? AND NOT EXISTS (SELECT 1 FROM entries WHERE digest = ?)",
+          (previous[0], previous[0])
+        )
+      self.db.commit()
+
+  # The server answered 304 Not Modified: the cached page is valid for another ttl
+  def refresh(self, url: str, ttl: float | None = None):
+    now = time.time()
+    with self.lock:
+      self.db.execute(
+        "UPDATE entries SET fetched_at = ?, expires_at = ?, last_access = ? WHERE url = ?",
+        (now, now + ttl if ttl is not None else None, now, url)
+      )
+      self.db.commit()
+
+  # Import a page from the previous cache layout the first time it is requested
+  # The page was fetched when its file was last written: with a ttl it expires ttl seconds after that (an old
+  # list page is imported already expired and gets fetched again), without one it is kept forever
+  def _get_legacy(self, url: str, ttl: float | None = None) -> CacheEntry | None:
+    if self.legacy_directory is None:
+      return None
+    filename = legacy_cache_filename(self.legacy_directory, url)
+    if not os.path.isfile(filename):
+      return None
+    with open(filename, encoding="utf-8") as f:
+      html = f.read()
+    if ttl is not None:
+      ttl = os.path.getmtime(filename) + ttl - time.time()
+    self.put(url, html, ttl)
+    return CacheEntry(html, ttl is None or ttl > 0, None, None)
+
+  def _delete_orphan_blobs(self):
+    self.db.execute("DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM entries)")
+
+  # Drop expired entries that cannot be revalidated, then the least recently used ones until the cache
+  # fits in max_bytes
+  # Return the number of entries removed
+  def evict(self, max_bytes: int | None = None) -> int:
+    with self.lock:
+      removed = self.db.execute(
+        "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ? AND etag IS NULL AND last_modified IS NULL",
+        (time.time(),)
+      ).rowcount
+      if max_bytes is not None:
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total > max_bytes:
+          rows = self.db.execute(
+            "SELECT e.url, b.size FROM entries e JOIN blobs b ON b.digest = e.digest ORDER BY e.last_access"
+          ).fetchall()
+          evicted = []
+          for url, size in rows:
+            if total <= max_bytes:
+              break
+            evicted.append((url,))
+            total -= size
+          self.db.executemany("DELETE FROM entries WHERE url = ?", evicted)
+          removed += len(evicted)
+      self._delete_orphan_blobs()
+      self.db.commit()
+    return removed
+
+  def stats(self) -> tuple[int, int]:
+    with self.lock:
+      entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+      size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+    return entries, size
+
+  # Async wrappers: sqlite access and (de)compression run in a thread, off the event loop
+  async def aget(self, url: str, ttl: float | None = None) -> str | None:
+    return await asyncio.to_thread(self.get, url, ttl)
+
+  async def alookup(self, url: str, ttl: float | None = None) -> CacheEntry | None:
+    return await asyncio.to_thread(self.lookup, url, ttl)
+
+  async def aput(self, url: str, html: str, ttl: float | None = None, etag: str | None = None, last_modified: str | None = None):
+    await asyncio.to_thread(self.put, url, html, ttl, etag, last_modified)
+
+  async def arefresh(self, url: str, ttl: float | None = None):
+    await asyncio.to_thread(self.refresh, url, ttl)
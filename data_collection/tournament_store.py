@@ -0,0 +1,243 @@
+from collections import namedtuple
+import argparse
+import json
+import os
+import struct
+import zlib
+
+# Compact, append-only storage for scraped tournaments
+#
+# File layout: MAGIC, then one record per tournament:
+#   payload length (uint32) | crc32 of payload (uint32) | id length (uint16) | id (utf-8) | payload
+# The payload is zlib-compressed (with a preset dictionary) compact JSON where every distinct card
+# of the tournament is stored once and decklists only reference it by index:
+#   {"t": [id, name, date, organizer, format, nb_players],
+#    "c": [[type, url, name], ...],
+#    "p": [[id, name, placing, country, [[card index, count], ...]], ...],
+#    "m": [[[player_id, score], ...], ...]}
+# Each record is self-contained, so it can be read from its offset alone. When a tournament is
+# appended twice, the last record wins.
+
+MAGIC = b"TPACK\x01"
+RECORD_HEADER = struct.Struct(">IIH")
+
+# Strings repeated in every record, used as zlib preset dictionary (never change it for this MAGIC)
+ZDICT = (
+  b'"Trainer","https://pocket.limitlesstcg.com/cards/P-A/'
+  b'"Pok\xc3\xa9mon","https://pocket.limitlesstcg.com/cards/A1/'
+  b'"Pok\xc3\xa9mon","https://pocket.limitlesstcg.com/cards/A2/'
+  b'"Pok\xc3\xa9mon","https://pocket.limitlesstcg.com/cards/A3/'
+  b'Professor\'s Research","Poke Ball"," ex"],[0,2],[1,2],[2,1],[3,1]]]'
+)
+
+default_store_path = "output/tournaments.pack"
+
+# Location of one tournament record inside a store file
+PackRecord = namedtuple("PackRecord", "path tournament_id offset length crc")
+
+TOURNAMENT_FIELDS = ("id", "name", "date", "organizer", "format", "nb_players")
+
+# Compact record of one tournament, built as its pages are scraped
+# Players can be added in any order: slot is their position in the tournament (standings order), so each
+# decklist is interned as soon as it is fetched and nothing else of the player needs to be kept
+class TournamentRecord:
+  def __init__(self, tournament: dict):
+    self.tournament_id = tournament["id"]
+    self.info = [tournament.get(field) for field in TOURNAMENT_FIELDS]
+    self.cards = []
+    self.card_indexes = {}
+    self.players = {}
+    self.matches = []
+
+  def card_index(self, card_type, url, name) -> int:
+    key = (card_type, url, name)
+    index = self.card_indexes.get(key)
+    if index is None:
+      index = self.card_indexes[key] = len(self.cards)
+      self.cards.append(list(key))
+    return index
+
+  # decklist: (type, url, name, count) of each card
+  def add_player(self, slot: int, player_id, name, placing, country, decklist):
+    self.players[slot] = [player_id, name, placing, country,
+                          [[self.card_index(card_type, url, card_name), count] for card_type, url, card_name, count in decklist]]
+
+  # results: (player_id, score) of each player of the match
+  def add_match(self, results):
+    self.matches.append([[player_id, score] for player_id, score in results])
+
+  @property
+  def nb_decklists(self) -> int:
+    return sum(1 for player in self.players.values() if player[4])
+
+  def encode(self) -> bytes:
+    compact = {
+      "t": self.info,
+      "c": self.cards,
+      "p": [self.players[slot] for slot in sorted(self.players)],
+      "m": self.matches,
+    }
+    compressor = zlib.compressobj(9, zdict=ZDICT)
+    data = json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return compressor.compress(data) + compressor.flush()
+
+def encode_tournament(tournament: dict) -> bytes:
+  record = TournamentRecord(tournament)
+  for slot, player in enumerate(tournament.get("players", [])):
+    record.add_player(slot, player.get("id"), player.get("name"), player.get("placing"), player.get("country"), [
+      (card.get("type"), card.get("url"), card.get("name"), card.get("count")) for card in player.get("decklist", [])
+    ])
+  for match in tournament.get("matches", []):
+    record.add_match((result.get("player_id"), result.get("score")) for result in match.get("match_results", []))
+  return record.encode()
+
+# Rebuild the dict shape written by the scraper (asdict(Tournament))
+def decode_tournament(payload: bytes) -> dict:
+  decompressor = zlib.decompressobj(zdict=ZDICT)
+  compact = json.loads(decompressor.decompress(payload) + decompressor.flush())
+  cards = compact["c"]
+  tournament = dict(zip(TOURNAMENT_FIELDS, compact["t"]))
+  tournament["players"] = [
+    {
+      "id": player_id,
+      "name": name,
+      "placing": placing,
+      "country": country,
+      "decklist": [
+        {"type": cards[index][0], "url": cards[index][1], "name": cards[index][2], "count": count}
+        for index, count in decklist
+      ],
+    }
+    for player_id, name, placing, country, decklist in compact["p"]
+  ]
+  tournament["matches"] = [
+    {"match_results": [{"player_id": player_id, "score": score} for player_id, score in match]}
+    for match in compact["m"]
+  ]
+  return tournament
+
+# List the records of a store file, in file order, keeping only the last record of each tournament
+# A truncated record at the end of the file (interrupted write) is ignored
+def scan_records(path: str) -> list[PackRecord]:
+  records = {}
+  if not os.path.isfile(path):
+    return []
+  with open(path, "rb") as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f"{path} is not a tournament store")
+    size = os.fstat(f.fileno()).st_size
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= size:
+      f.seek(offset)
+      length, crc, id_length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+      payload_offset = offset + RECORD_HEADER.size + id_length
+      if payload_offset + length > size:
+        break
+      tournament_id = f.read(id_length).decode("utf-8")
+      records.pop(tournament_id, None)
+      records[tournament_id] = PackRecord(path, tournament_id, payload_offset, length, crc)
+      offset = payload_offset + length
+  return list(records.values())
+
+# Raises ValueError when the payload does not match the crc32 stored in its header (corrupted record)
+def read_payload(record: PackRecord) -> bytes:
+  with open(record.path, "rb") as f:
+    f.seek(record.offset)
+    payload = f.read(record.length)
+  if zlib.crc32(payload) != record.crc:
+    raise ValueError(f"tournament {record.tournament_id} in {record.path} is corrupted (crc32 mismatch)")
+  return payload
+
+def read_record(record: PackRecord) -> dict:
+  return decode_tournament(read_payload(record))
+
+class TournamentStore:
+  def __init__(self, path: str = default_store_path):
+    self.path = path
+    self.records = {record.tournament_id: record for record in scan_records(path)}
+
+  def __contains__(self, tournament_id: str):
+    return tournament_id in self.records
+
+  def __len__(self):
+    return len(self.records)
+
+  # Stream the tournaments, one decoded dict at a time
+  def __iter__(self):
+    for record in self.records.values():
+      yield read_record(record)
+
+  def get(self, tournament_id: str) -> dict | None:
+    record = self.records.get(tournament_id)
+    return read_record(record) if record is not None else None
+
+  def append(self, tournament: dict):
+    self.append_payload(tournament["id"], encode_tournament(tournament))
+
+  def append_record(self, record: TournamentRecord):
+    self.append_payload(record.tournament_id, record.encode())
+
+  def append_payload(self, tournament_id: str, payload: bytes):
+    encoded_id = tournament_id.encode("utf-8")
+
+    directory = os.path.dirname(self.path)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+
+    with open(self.path, "ab") as f:
+      if f.tell() == 0:
+        f.write(MAGIC)
+      else:
+        # Drop a partially written record left by an interrupted run
+        end = self._end_offset()
+        if end != f.tell():
+          f.truncate(end)
+          f.seek(end)
+      header = RECORD_HEADER.pack(len(payload), zlib.crc32(payload), len(encoded_id))
+      offset = f.tell() + len(header) + len(encoded_id)
+      f.write(header + encoded_id + payload)
+      f.flush()
+      os.fsync(f.fileno())
+
+    self.records.pop(tournament_id, None)
+    self.records[tournament_id] = PackRecord(self.path, tournament_id, offset, len(payload), zlib.crc32(payload))
+
+  def _end_offset(self) -> int:
+    if not self.records:
+      return len(MAGIC)
+    return max(record.offset + record.length for record in self.records.values())
+
+  # Write every tournament back as {id}.json, in the historical indented format
+  def export_json(self, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for tournament in self:
+      with open(os.path.join(directory, f"{tournament['id']}.json"), "w") as f:
+        json.dump(tournament, f, indent=2)
+
+  # Append every {id}.json file of a directory that is not already in the store
+  # Other JSON files of the output directory (watermark.json) are not tournaments and are skipped
+  def import_json(self, directory: str) -> int:
+    imported = 0
+    for filename in sorted(os.listdir(directory)):
+      if not filename.lower().endswith(".json"):
+        continue
+      with open(os.path.join(directory, filename), encoding="utf-8") as f:
+        tournament = json.load(f)
+      if isinstance(tournament, dict) and "players" in tournament and tournament.get("id") not in self:
+        self.append(tournament)
+        imported += 1
+    return imported
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Convert between the tournament store and per-tournament JSON files")
+  parser.add_argument("command", choices=["export", "import"])
+  parser.add_argument("directory", help="directory of {id}.json files")
+  parser.add_argument("--store", default=default_store_path)
+  args = parser.parse_args()
+
+  store = TournamentStore(args.store)
+  if args.command == "export":
+    store.export_json(args.directory)
+    print(f"exported {len(store)} tournaments to {args.directory}")
+  else:
+    print(f"imported {store.import_json(args.directory)} tournaments into {args.store}")
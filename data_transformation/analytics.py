@@ -0,0 +1,114 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Moteur de calcul vectorisé (--engine numpy)
+# Les tournois d'un lot sont chargés en colonnes : matchs, joueurs et cartes deviennent des tableaux numpy
+# de codes entiers (joueur = (tournoi, id d'origine), carte = nom résolu, tournoi = position dans le lot).
+# Victoires / défaites, winrates, nombre de decks par carte et dernière extension de chaque tournoi sont
+# calculés par des group-by vectorisés (reduceat, bincount, unique) au lieu de boucles sur des dicts.
+# Les résultats sont identiques à ceux de transform_tournament, y compris l'ordre des cartes.
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("Le moteur numpy nécessite numpy (pip install numpy)")
+
+# Victoires et défaites de chaque joueur
+# match : numéro du match de chaque résultat (0, 0, 1, 1, 2… : les résultats d'un match sont contigus)
+# Un match n'est compté que s'il a un unique meilleur score : ce joueur gagne, les autres perdent
+
+def player_stats(match, player, score, nb_players: int):
+    if len(match) == 0:
+        return np.zeros(nb_players, np.int64), np.zeros(nb_players, np.int64)
+    starts = np.flatnonzero(np.diff(match, prepend=-1))
+    best = np.maximum.reduceat(score, starts)
+    is_best = score == best[match]
+    decided = (np.add.reduceat(is_best.astype(np.int64), starts) == 1)[match]
+    wins = np.bincount(player[decided & is_best], minlength=nb_players)
+    losses = np.bincount(player[decided & ~is_best], minlength=nb_players)
+    return wins, losses
+
+# Winrate entier (tronqué) ; un joueur sans match décidé a 0 %
+
+def winrates(wins, losses):
+    total = wins + losses
+    return wins * 100 // np.where(total == 0, 1, total)
+
+# Nombre de decks (joueurs distincts) contenant chaque carte, par tournoi
+# Renvoie (tournoi, carte, nombre) dans l'ordre de première apparition de la carte dans le tournoi
+
+def card_deck_counts(tournament, player, name, nb_players: int, nb_names: int):
+    if len(name) == 0:
+        return [], [], []
+    _, first = np.unique(name * nb_players + player, return_index=True)
+    first.sort()
+    keys = tournament[first] * nb_names + name[first]
+    uniq, first_key, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first_key, kind="stable")
+    uniq = uniq[order]
+    return (uniq // nb_names).tolist(), (uniq % nb_names).tolist(), counts[order].tolist()
+
+# Statistiques d'un lot de tournois
+# Renvoie, pour chaque tournoi : (dernière extension, [(victoires, défaites, winrate)] de chaque joueur
+# dans l'ordre de t['players'], {carte: nombre de decks}, [cartes résolues de chaque decklist])
+
+def batch_statistics(tournaments: list[dict], index) -> list[tuple]:
+    require_numpy()
+    ext_rank = {code: rank for rank, code in enumerate(index.ext_order)}
+    players = {}
+    names = {}
+    m_match, m_player, m_score = [], [], []
+    slot_player = []
+    slot_refs = []
+    c_tournament, c_player, c_name, c_rank = [], [], [], []
+
+    nb_matches = 0
+    for ti, t in enumerate(tournaments):
+        for m in t.get('matches', []):
+            res = m.get('match_results', [])
+            if not res:
+                continue
+            for r in res:
+                m_match.append(nb_matches)
+                m_player.append(players.setdefault((ti, r.get('player_id','')), len(players)))
+                m_score.append(r.get('score', 0))
+            nb_matches += 1
+        for pl in t.get('players', []):
+            p = players.setdefault((ti, pl.get('id','')), len(players))
+            slot_player.append(p)
+            refs = [index.resolve(c.get('name',''), c.get('url','')) for c in pl.get('decklist', [])]
+            slot_refs.append(refs)
+            for ref in refs:
+                c_tournament.append(ti)
+                c_player.append(p)
+                c_name.append(names.setdefault(ref.name, len(names)))
+                c_rank.append(ext_rank.get(ref.ext, -1))
+
+    nb_players = len(players)
+    wins, losses = player_stats(np.array(m_match, np.int64), np.array(m_player, np.int64),
+                                np.array(m_score), nb_players)
+    slot_player = np.array(slot_player, np.int64)
+    slot_wins = wins[slot_player]
+    slot_losses = losses[slot_player]
+    slot_stats = list(zip(slot_wins.tolist(), slot_losses.tolist(), winrates(slot_wins, slot_losses).tolist()))
+
+    c_tournament = np.array(c_tournament, np.int64)
+    latest = np.full(len(tournaments), -1, np.int64)
+    np.maximum.at(latest, c_tournament, np.array(c_rank, np.int64))
+    latest = latest.tolist()
+
+    counts = [{} for _ in tournaments]
+    name_list = list(names)
+    for ti, nm, nb in zip(*card_deck_counts(c_tournament, np.array(c_player, np.int64),
+                                            np.array(c_name, np.int64), nb_players, len(names))):
+        counts[ti][name_list[nm]] = nb
+
+    stats = []
+    offset = 0
+    for ti, t in enumerate(tournaments):
+        nb = len(t.get('players', []))
+        stats.append((index.ext_order[latest[ti]] if latest[ti] >= 0 else '', slot_stats[offset:offset + nb],
+                      counts[ti], slot_refs[offset:offset + nb]))
+        offset += nb
+    return stats
@@ -0,0 +1,55 @@
+from functools import lru_cache
+
+# Classification des decks en archétypes
+# Le nom d'un deck est formé de ses deux cartes clés : priorité aux EX, puis au stage, puis aux HP,
+# en écartant une carte qui évolue depuis (ou vers) une carte déjà retenue
+
+class DeckClassifier:
+    def __init__(self, index, maxsize: int = 65536):
+        # index doit fournir resolve(nom, url) -> CardRef et evolves_map (voir CardIndex dans main.py)
+        self.index = index
+        self._classify = lru_cache(maxsize=maxsize)(self._classify_pokemons)
+
+    # Multiset canonique des Pokémon d'une decklist : tuple trié de (nom, stage, hp)
+    # Deux decks avec les mêmes Pokémon partagent la même clé, quel que soit l'ordre des cartes
+    def pokemon_key(self, decklist: list[dict]) -> tuple:
+        mons = []
+        for c in decklist:
+            if c.get('type') != 'Pokémon':
+                continue
+            ref = self.index.resolve(c.get('name',''), c.get('url',''))
+            mons.append((ref.key_name, ref.stage, ref.hp))
+        return tuple(sorted(mons))
+
+    # Nom de deck d'une decklist, '' si elle ne contient aucun Pokémon
+    def classify(self, decklist: list[dict]) -> str:
+        return self._classify(self.pokemon_key(decklist))
+
+    # Nombre de décisions servies par le cache (hits) ou calculées (misses)
+    def cache_info(self):
+        return self._classify.cache_info()
+
+    def _classify_pokemons(self, mons: tuple) -> str:
+        evolves_map = self.index.evolves_map
+        # Trier: priorité EX, puis stage décroissant, puis HP décroissant (à égalité : ordre alphabétique)
+        mons_sorted = sorted(
+            mons,
+            key=lambda x: (
+                0 if x[0].lower().endswith(' ex') else 1,
+                -x[1],
+                -x[2]
+            )
+        )
+        key_cards = []
+        for nm, st, hp_val in mons_sorted:
+            conflict = False
+            for sel in key_cards:
+                if evolves_map.get(nm,'') == sel or evolves_map.get(sel,'') == nm:
+                    conflict = True
+                    break
+            if conflict:
+                continue
+            key_cards.append(nm)
+            if len(key_cards) == 2:
+                break
+        return " - ".join(sorted(key_cards))
@@ -0,0 +1,105 @@
+from array import array
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+# Statistiques des paires de cartes jouées ensemble, par extension (table card_pair_stats)
+# Chaque extension a sa matrice d'incidence creuse A (decks × cartes, 1 si la carte est dans le deck) :
+#   AᵀA donne le nombre de decks contenant chaque paire de cartes,
+#   Aᵀ·diag(victoires)·A et Aᵀ·diag(défaites)·A les victoires et défaites cumulées de ces decks,
+# sans aucune boucle sur les paires. Seules les paires présentes dans au moins min_decks decks sont gardées.
+
+class DeckIncidence:
+    def __init__(self):
+        self.deck_ids = array('i')
+        self.card_ids = array('i')
+        self.wins = array('i')
+        self.losses = array('i')
+
+    def __len__(self):
+        return len(self.wins)
+
+class CardPairStats:
+    def __init__(self, min_decks: int = 3):
+        if sparse is None:
+            raise RuntimeError("Le calcul des paires de cartes nécessite scipy (pip install scipy)")
+        self.min_decks = min_decks
+        self.cards = {}
+        self.extensions = {}
+
+    # Ajoute un deck : noms de ses cartes, victoires et défaites de son joueur
+    def add_deck(self, ext: str, card_names, wins: int, losses: int):
+        decks = self.extensions.setdefault(ext, DeckIncidence())
+        deck_id = len(decks)
+        for nm in sorted(card_names):
+            decks.deck_ids.append(deck_id)
+            decks.card_ids.append(self.cards.setdefault(nm, len(self.cards)))
+        decks.wins.append(wins)
+        decks.losses.append(losses)
+
+    # Reçoit chaque tournoi transformé (voir TransformState.sinks)
+    def add(self, result: dict, deck_rows: list[tuple]):
+        for _, _, _, rows in result['players']:
+            if rows:
+                self.add_deck(result['extension'], {row[1] for row in rows}, rows[0][5], rows[0][6])
+
+    # Reconstruit les decks depuis le schéma en étoile (run incrémental)
+    # Curseur nommé : les lignes sont lues par paquets, sans charger fact_deck_card en mémoire
+    def load(self, conn):
+        with conn.cursor(name="card_pairs") as cur:
+            cur.itersize = 100_000
+            cur.execute("""
+                SELECT f.tournament_key, f.player_key, COALESCE(e.extension_code, ''), c.card_name,
+                       d.win_count, d.loss_count
+                FROM public.fact_deck_card f
+                JOIN public.fact_deck d ON d.tournament_key = f.tournament_key AND d.player_key = f.player_key
+                JOIN public.dim_card c ON c.card_key = f.card_key
+                JOIN public.dim_tournament t ON t.tournament_key = f.tournament_key
+                LEFT JOIN public.dim_extension e ON e.extension_key = t.extension_key
+                ORDER BY f.tournament_key, f.player_key
+            """)
+            deck, ext, names, stats = None, None, set(), None
+            for tkey, pkey, deck_ext, nm, w, l in cur:
+                if (tkey, pkey) != deck:
+                    if names:
+                        self.add_deck(ext, names, *stats)
+                    deck, ext, names, stats = (tkey, pkey), deck_ext, set(), (w, l)
+                names.add(nm)
+            if names:
+                self.add_deck(ext, names, *stats)
+
+    def pair_rows(self, ext: str, decks: DeckIncidence):
+        nb_cards = len(self.cards)
+        deck_ids = np.frombuffer(decks.deck_ids, dtype=np.int32)
+        card_ids = np.frombuffer(decks.card_ids, dtype=np.int32)
+        incidence = sparse.csr_matrix((np.ones(len(deck_ids), np.int32), (deck_ids, card_ids)),
+                                      shape=(len(decks), nb_cards))
+        incidence_t = incidence.T.tocsr()
+        counts = sparse.triu(incidence_t @ incidence, k=1).tocoo()
+        keep = counts.data >= self.min_decks
+        # Aucune paire assez fréquente : l'indexation par des tableaux vides renverrait une matrice
+        if not keep.any():
+            return
+        card_a, card_b, deck_count = counts.row[keep], counts.col[keep], counts.data[keep]
+        wins = incidence_t @ sparse.diags(np.frombuffer(decks.wins, dtype=np.int32), dtype=np.int64) @ incidence
+        losses = incidence_t @ sparse.diags(np.frombuffer(decks.losses, dtype=np.int32), dtype=np.int64) @ incidence
+        win_count = np.asarray(wins.tocsr()[card_a, card_b]).ravel()
+        loss_count = np.asarray(losses.tocsr()[card_a, card_b]).ravel()
+        total = win_count + loss_count
+        winrate = win_count * 100 // np.where(total == 0, 1, total)
+
+        names = list(self.cards)
+        for a, b, nb, w, l, wr in zip(card_a.tolist(), card_b.tolist(), deck_count.tolist(),
+                                      win_count.tolist(), loss_count.tolist(), winrate.tolist()):
+            name_a, name_b = sorted((names[a], names[b]))
+            yield (ext, name_a, name_b, nb, w, l, wr)
+
+    # Lignes card_pair_stats de toutes les extensions
+    def rows(self):
+        for ext, decks in sorted(self.extensions.items()):
+            if len(decks):
+                yield from self.pair_rows(ext, decks)
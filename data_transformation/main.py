@@ -1,11 +1,26 @@
 import psycopg
+import argparse
+import hashlib
 import os
 import json
+import pickle
 from datetime import datetime
 import sys
-from collections import defaultdict
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 import re
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_collection"))
+
+from analytics import batch_statistics, require_numpy
+from archetypes import DeckClassifier
+from card_pairs import CardPairStats
+from tournament_store import PackRecord, scan_records, read_payload, decode_tournament
+from parquet_export import ParquetExporter
+from profiling import StageProfiler
+
 sys.stdout.reconfigure(encoding='utf-8')
 
 postgres_db = "postgres"
@@ -18,6 +33,18 @@ output_directory = "../data_collection/output"
 # Chemins relatifs vers les fichiers JSON
 json_all_cards = os.path.join("..", "data_collection", "all_cards.json")
 json_extensions = os.path.join("..", "data_collection", "extensions.json")
+# Index des cartes précalculé, reconstruit quand les deux fichiers ci-dessus changent
+card_index_file = "card_index.pickle"
+# Fichier compact écrit par le scraper
+tournament_store_file = os.path.join(output_directory, "tournaments.pack")
+# Historique des rapports --profile (une ligne JSON par run)
+profile_report_file = "profile_runs.jsonl"
+
+# Instrumentation par étape, active avec --profile (voir profiling.py)
+profiler = StageProfiler()
+# Étapes mesurées ; read_transform est la lecture et la transformation des tournois pendant l'étape facts
+PROFILE_STAGES = ("card_index", "prepare", "facts", "read_transform", "dimensions", "indexes", "aggregates",
+                  "card_pairs", "commit", "parquet")
 
 # Helpers
 
@@ -37,345 +64,1299 @@ def parse_card_code_from_url(url: str) -> str:
     parts = url.split('/cards/')
     return parts[1].split('/')[0] if len(parts) > 1 else ''
 
-# Charge les extensions triées par date
+def parse_int(text: str) -> int | None:
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        return None
 
-def load_extensions() -> list[str]:
+# Extensions décrites dans extensions.json : code -> (nom, date de sortie, nombre de cartes)
+
+def load_extension_info() -> dict:
     if not os.path.isfile(json_extensions):
-        return []
+        return {}
     raw = json.load(open(json_extensions, encoding='utf-8'))
-    exts = []
+    info = {}
     for e in raw:
-        ds = e.get('release_date','').strip()
-        if not ds:
+        code = e.get('code','').strip()
+        if not code:
             continue
         try:
-            dt = datetime.strptime(ds, "%d %b %y")
-        except:
-            continue
-        code = e.get('code','').strip()
-        if code:
-            exts.append((code, dt))
+            dt = datetime.strptime(e.get('release_date','').strip(), "%d %b %y")
+        except ValueError:
+            dt = None
+        info[code] = (e.get('name','').strip(), dt, parse_int(str(e.get('card_count',''))))
+    return info
+
+# Charge les extensions triées par date
+
+def load_extensions() -> list[str]:
+    exts = [(code, dt) for code, (_, dt, _) in load_extension_info().items() if dt is not None]
     exts.sort(key=lambda x: x[1])
     return [code for code, _ in exts]
 
+# Sources des tournois : fichiers JSON historiques ({id}.json) et entrées du fichier compact du scraper
+# (voir data_collection/tournament_store.py), dans un ordre stable pour que la numérotation
+# des joueurs ne change pas d'un run à l'autre. Un tournoi présent dans le fichier compact
+# n'est pas relu depuis son ancien fichier JSON.
+
+def list_tournament_sources() -> list:
+    if not os.path.isdir(output_directory):
+        return []
+    records = scan_records(tournament_store_file)
+    packed = set(record.tournament_id for record in records)
+    sources = [os.path.join(output_directory, fn)
+               for fn in sorted(os.listdir(output_directory))
+               if fn.lower().endswith(".json") and fn[:-5] not in packed]
+    return sources + records
+
+# Nom d'une source dans le manifeste
+
+def source_name(source) -> str:
+    if isinstance(source, PackRecord):
+        return f"{os.path.basename(source.path)}#{source.tournament_id}"
+    return os.path.basename(source)
+
+# Empreinte rapide : (mtime_ns, taille) d'un fichier, (position, longueur) d'une entrée du fichier compact
+
+def source_stat(source) -> tuple[int, int]:
+    if isinstance(source, PackRecord):
+        return source.offset, source.length
+    st = os.stat(source)
+    return st.st_mtime_ns, st.st_size
+
+def read_source(source) -> bytes:
+    if isinstance(source, PackRecord):
+        return read_payload(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+def decode_source(source, data: bytes) -> dict | None:
+    try:
+        t = decode_tournament(data) if isinstance(source, PackRecord) else json.loads(data)
+    except Exception:
+        return None
+    # Le dossier contient aussi des fichiers JSON qui ne sont pas des tournois (watermark.json du scraper)
+    return t if isinstance(t, dict) and 'players' in t else None
+
+# Lit un tournoi, None s'il est illisible (entrée corrompue du fichier compact comprise)
+
+def read_tournament(source) -> dict | None:
+    try:
+        return decode_source(source, read_source(source))
+    except (OSError, ValueError):
+        return None
+
+# Itère sur les tournois un par un : un seul tournoi en mémoire à la fois
+
+def iter_tournaments(sources=None):
+    for source in (list_tournament_sources() if sources is None else sources):
+        t = read_tournament(source)
+        if t is not None:
+            yield t
+
 # Charge tous les tournois JSON en mémoire
 
 def load_all_tournaments() -> list[dict]:
-    tournaments = []
-    if not os.path.isdir(output_directory):
-        return tournaments
-    for fn in os.listdir(output_directory):
-        if not fn.lower().endswith(".json"):
-            continue
-        path = os.path.join(output_directory, fn)
+    return list(iter_tournaments())
+
+# Référence résolue d'une carte de decklist
+# name / url / code : valeurs nettoyées pour wrk_decklists, ext : code extension brut,
+# key_name : nom sans suffixe "(...)", stage : 2 / 1 / 0, hp : 0 si inconnu
+
+CardRef = namedtuple("CardRef", "name url code ext key_name stage hp")
+
+def stage_level(stage: str) -> int:
+    return 2 if 'Stage 2' in stage else 1 if 'Stage 1' in stage else 0
+
+# Index des cartes construit à partir de all_cards.json et extensions.json
+# Sauvegardé sur disque (pickle) et reconstruit seulement si l'un des deux fichiers change
+# Le fichier ne contient que des données simples (voir data) : il se relit que main.py soit lancé en script
+# ou importé comme module (benchmarks), une instance de CardIndex y serait liée à __main__ ou à main
+
+class CardIndex:
+    VERSION = 2
+
+    def __init__(self, sources, by_key, by_url, evolves_map, uniq_cards, ext_order):
+        self.sources = sources          # empreinte (mtime_ns, taille) des fichiers sources
+        self.by_key = by_key            # (nom, code extension) -> (stage, hp)
+        self.by_url = by_url            # url -> (nom, code extension)
+        self.evolves_map = evolves_map  # nom -> nom de la pré-évolution
+        self.uniq_cards = uniq_cards    # cartes distinctes pour all_pokemon_cards
+        self.ext_order = ext_order      # codes d'extension triés par date de sortie
+        self._resolved = {}
+
+    # Arguments du constructeur, sauvegardés sur disque
+    def data(self) -> tuple:
+        return self.sources, self.by_key, self.by_url, self.evolves_map, self.uniq_cards, self.ext_order
+
+    # Le cache de résolution n'est pas envoyé aux workers
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_resolved'] = {}
+        return state
+
+    @staticmethod
+    def fingerprint():
+        fp = []
+        for path in (json_all_cards, json_extensions):
+            try:
+                st = os.stat(path)
+                fp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                fp.append(None)
+        return tuple(fp)
+
+    @classmethod
+    def build(cls):
+        if not os.path.isfile(json_all_cards):
+            raise FileNotFoundError(f"Fichier all_cards.json introuvable : {json_all_cards}")
+        sources = cls.fingerprint()
+        with open(json_all_cards, encoding="utf-8") as f:
+            all_cards_json = json.load(f)
+        uniq_cards = {}
+        by_key = {}
+        by_url = {}
+        evolves_map = {}
+        for c in all_cards_json:
+            name = c.get('name','')
+            full_url = c.get('full_url','')
+            ext_code = parse_card_code_from_url(full_url)
+            hp_str = c.get('hp','').strip()
+            try:
+                hp_val = int(hp_str)
+            except:
+                hp_val = 0
+            by_key[(name, ext_code)] = (stage_level(c.get('stage','')), hp_val)
+            by_url[full_url] = (name, ext_code)
+            evolves_map[name] = c.get('evolves_from','').strip()
+            key = (name, c.get('attack',''), c.get('extension',''))
+            if key not in uniq_cards:
+                uniq_cards[key] = c
+        return cls(sources, by_key, by_url, evolves_map, list(uniq_cards.values()), load_extensions())
+
+    # Charge l'index sauvegardé, ou le reconstruit si les fichiers sources ont changé
+    # Un fichier illisible ou impossible à écrire est traité comme un cache absent
+    @classmethod
+    def load(cls, path: str = None):
+        path = path or card_index_file
         try:
-            t = json.load(open(path, encoding="utf-8"))
-            if isinstance(t, dict):
-                tournaments.append(t)
+            with open(path, "rb") as f:
+                version, data = pickle.load(f)
+            if version == cls.VERSION and data[0] == cls.fingerprint():
+                return cls(*data)
         except Exception:
             pass
-    return tournaments
+        index = cls.build()
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((cls.VERSION, index.data()), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Index des cartes non sauvegardé : {e}")
+        return index
+
+    # Résout une carte de decklist ; chaque couple (nom, url) n'est analysé qu'une fois
+    def resolve(self, name: str, url: str) -> CardRef:
+        ref = self._resolved.get((name, url))
+        if ref is not None:
+            return ref
+        known = self.by_url.get(url)
+        if known is not None:
+            ext = known[1]
+        else:
+            ext = parse_card_code_from_url(url)
+        if known is not None and name == known[0] and not name.endswith(')'):
+            key_name = name
+        else:
+            key_name = parse_card_name(name)
+        stage, hp_val = self.by_key.get((key_name, ext), (0, 0))
+        clean_url = remove_non_encodable(url)
+        ref = CardRef(
+            remove_non_encodable(name),
+            clean_url,
+            remove_non_encodable(parse_card_code_from_url(clean_url)),
+            ext,
+            key_name,
+            stage,
+            hp_val,
+        )
+        self._resolved[(name, url)] = ref
+        return ref
+
+# Victoires / défaites de chaque joueur d'un tournoi
+
+def compute_player_stats(matches: list[dict]) -> dict:
+    pstats = defaultdict(lambda: {'wins':0,'losses':0})
+    for m in matches:
+        res = m.get('match_results', [])
+        if not res:
+            continue
+        scores = [r.get('score', 0) for r in res]
+        maxs = max(scores)
+        if scores.count(maxs) == 1:
+            for r in res:
+                pid = r.get('player_id','')
+                if r.get('score',0) == maxs:
+                    pstats[pid]['wins'] += 1
+                else:
+                    pstats[pid]['losses'] += 1
+    return pstats
 
-# Calcule les données à insérer, incluant deck_summary
+# Ligne wrk_tournaments d'un tournoi
+
+def tournament_row(t: dict) -> tuple:
+    tid = remove_non_encodable(t.get('id',''))
+    name = remove_non_encodable(t.get('name',''))
+    try:
+        date = datetime.fromisoformat(t.get('date','').replace('Z','+00:00')).replace(tzinfo=None)
+    except:
+        date = None
+    org = remove_non_encodable(t.get('organizer',''))
+    fmt = remove_non_encodable(t.get('format',''))
+    nb  = int(t.get('nb_players', 0))
+    return (tid, name, date, org, fmt, nb)
+
+# Confrontations entre archétypes d'un tournoi, vues de chaque côté : (deck, deck adverse) -> [victoires,
+# défaites, égalités]. decks associe l'id d'origine de chaque joueur à son archétype : une recherche par
+# joueur, le calcul reste linéaire en nombre de matchs. Seuls les matchs à deux joueurs ayant chacun un
+# archétype sont comptés ; un match miroir compte des deux côtés.
+
+def compute_matchups(matches: list[dict], decks: dict) -> dict:
+    matchups = {}
+    for m in matches:
+        res = m.get('match_results', [])
+        if len(res) != 2:
+            continue
+        deck_a = decks.get(res[0].get('player_id',''))
+        deck_b = decks.get(res[1].get('player_id',''))
+        if not deck_a or not deck_b:
+            continue
+        score_a = res[0].get('score', 0)
+        score_b = res[1].get('score', 0)
+        outcome = 0 if score_a > score_b else 1 if score_a < score_b else 2
+        matchups.setdefault((deck_a, deck_b), [0, 0, 0])[outcome] += 1
+        matchups.setdefault((deck_b, deck_a), [0, 0, 0])[(1, 0, 2)[outcome]] += 1
+    return matchups
+
+# Nombre d'exemplaires d'une carte de decklist (1 si absent des anciens fichiers)
+
+def card_count(c: dict) -> int:
+    try:
+        return int(c.get('count', 1))
+    except (TypeError, ValueError):
+        return 1
+
+# Transforme un tournoi, indépendamment des autres
+# Les lignes de decklist (deck_type, nom, url, code, exemplaires, victoires, défaites, winrate) sont
+# renvoyées sans tournoi ni joueur : la numérotation anonyme est globale
+
+def transform_tournament(t: dict, index: CardIndex, classifier: DeckClassifier) -> dict:
+    row = tournament_row(t)
+
+    # Détermine latest extension pour ce tournoi
+    ext_codes_in_tourn = set(index.resolve(c.get('name',''), c.get('url','')).ext
+                            for pl in t.get('players',[]) for c in pl.get('decklist', []))
+    latest_ext = ''
+    for code in index.ext_order:
+        if code in ext_codes_in_tourn:
+            latest_ext = code
+
+    pstats = compute_player_stats(t.get('matches', []))
+
+    players = []
+    card_decks = defaultdict(set)
+    for pl in t.get('players', []):
+        orig = pl.get('id','')
+        w = pstats.get(orig, {}).get('wins', 0)
+        l = pstats.get(orig, {}).get('losses', 0)
+        total = w + l or 1
+        wr = int(w * 100 / total)
+
+        deck_rows = []
+        for c in pl.get('decklist', []):
+            deck_type = remove_non_encodable(c.get('type',''))
+            ref = index.resolve(c.get('name',''), c.get('url',''))
+            deck_rows.append((deck_type, ref.name, ref.url, ref.code, card_count(c), w, l, wr))
+            card_decks[ref.name].add(orig)
+
+        deck_name = classifier.classify(pl.get('decklist', []))
+        players.append((orig, wr, deck_name, deck_rows))
+
+    return {
+        'id': row[0],
+        'row': row,
+        'extension': latest_ext,
+        'players': players,
+        'card_deck_counts': {nm: len(decks) for nm, decks in card_decks.items()},
+        'matchups': compute_matchups(t.get('matches', []), {orig: deck_name for orig, _, deck_name, _ in players}),
+    }
+
+# Équivalent de transform_tournament pour un lot de tournois, statistiques calculées par analytics.py
+
+def transform_batch(tournaments: list[dict], index: CardIndex, classifier: DeckClassifier) -> list[dict]:
+    results = []
+    deck_types = {}
+    for t, (latest_ext, stats, card_deck_counts, refs) in zip(tournaments, batch_statistics(tournaments, index)):
+        row = tournament_row(t)
+        players = []
+        for pl, (w, l, wr), deck_refs in zip(t.get('players', []), stats, refs):
+            deck_rows = []
+            for c, ref in zip(pl.get('decklist', []), deck_refs):
+                deck_type = c.get('type','')
+                if deck_type not in deck_types:
+                    deck_types[deck_type] = remove_non_encodable(deck_type)
+                deck_rows.append((deck_types[deck_type], ref.name, ref.url, ref.code, card_count(c), w, l, wr))
+            players.append((pl.get('id',''), wr, classifier.classify(pl.get('decklist', [])), deck_rows))
+        results.append({
+            'id': row[0],
+            'row': row,
+            'extension': latest_ext,
+            'players': players,
+            'card_deck_counts': card_deck_counts,
+            'matchups': compute_matchups(t.get('matches', []), {orig: deck_name for orig, _, deck_name, _ in players}),
+        })
+    return results
+
+# État global du pipeline : numérotation anonyme des joueurs, clés du schéma en étoile et agrégats
+# Seuls les agrégats et les dimensions sont conservés, jamais les tournois ni leurs lignes (voir add)
+
+class TransformState:
+    def __init__(self, index: CardIndex = None, user_map=None):
+        self.index = index if index is not None else CardIndex.load()
+        self.classifier = DeckClassifier(self.index)
+        self.user_map = dict(user_map or {})
+        self.next_user_id = max(self.user_map.values(), default=0) + 1
+        self.new_users = []
+        self.nb_tournaments = 0
+        self.nb_decks = 0
+        # Clés entières du schéma en étoile (voir load_dimensions pour un run incrémental)
+        self.next_tournament_key = 1
+        self.tournament_keys = {}       # tournament_id -> clé, tournois de ce run
+        self.extension_keys = {}        # code extension -> clé
+        self.card_keys = {}             # (deck_type, nom, url) -> clé
+        self.new_cards = []             # lignes dim_card des cartes vues pour la première fois
+        for code in self.index.ext_order:
+            self.extension_key(code)
+        self.card_deck_counts = defaultdict(int)
+        self.summary = {}
+        # (deck, deck adverse, extension) -> [victoires, défaites, égalités]
+        self.matchups = {}
+        # Contribution des tournois transformés aux tendances : (jour, extension, deck) -> [decks, somme des winrates]
+        self.daily_rollup = {}
+        # Consommateurs supplémentaires des tournois transformés : sink.add(result, deck_rows)
+        self.sinks = []
+
+    def player_id(self, orig: str) -> int:
+        if orig not in self.user_map:
+            self.user_map[orig] = self.next_user_id
+            self.new_users.append((orig, self.next_user_id))
+            self.next_user_id += 1
+        return self.user_map[orig]
+
+    def extension_key(self, code: str) -> int | None:
+        if not code:
+            return None
+        if code not in self.extension_keys:
+            self.extension_keys[code] = len(self.extension_keys) + 1
+        return self.extension_keys[code]
+
+    def card_key(self, deck_type: str, name: str, url: str, code: str) -> int:
+        key = self.card_keys.get((deck_type, name, url))
+        if key is None:
+            key = self.card_keys[(deck_type, name, url)] = len(self.card_keys) + 1
+            self.new_cards.append((key, deck_type, name, url, code, self.extension_key(code)))
+        return key
+
+    # Clés déjà attribuées en base ; à appeler après la purge des tournois rechargés
+    def load_dimensions(self, cur):
+        cur.execute("SELECT COALESCE(MAX(tournament_key), 0) FROM public.dim_tournament")
+        self.next_tournament_key = cur.fetchone()[0] + 1
+        cur.execute("SELECT extension_code, extension_key FROM public.dim_extension")
+        self.extension_keys = dict(cur.fetchall())
+        for code in self.index.ext_order:
+            self.extension_key(code)
+        cur.execute("SELECT deck_type, card_name, card_url, card_key FROM public.dim_card")
+        self.card_keys = {(deck_type, name, url): key for deck_type, name, url, key in cur.fetchall()}
+
+    # Intègre un tournoi transformé et renvoie ses lignes, par table (voir STREAMED_TABLES)
+    # wrk_card_usage et wrk_deck_matchups : contributions du tournoi, conservées en base pour les runs incrémentaux
+    def add(self, result: dict) -> dict[str, list[tuple]]:
+        tid = result['id']
+        ext = result['extension']
+        date = result['row'][2]
+        tables = {table: [] for table in STREAMED_TABLES}
+        tournament_key = self.tournament_keys.get(tid)
+        if tournament_key is None:
+            tournament_key = self.tournament_keys[tid] = self.next_tournament_key
+            self.next_tournament_key += 1
+            tables["dim_tournament"].append((tournament_key,) + result['row'] + (self.extension_key(ext),))
+        self.nb_tournaments += 1
+        for nm, nb_decks in result['card_deck_counts'].items():
+            self.card_deck_counts[nm] += nb_decks
+            tables["wrk_card_usage"].append((tid, nm, nb_decks))
+        # Lignes au format de la vue wrk_decklists, pour les consommateurs supplémentaires
+        deck_rows = []
+        for orig, wr, deck_name, rows in result['players']:
+            player_key = self.player_id(orig)
+            pid = str(player_key)
+            deck_rows.extend((tid, pid) + row[:4] + row[5:] + row[4:5] for row in rows)
+            if rows:
+                self.nb_decks += 1
+                tables["fact_deck"].append((tournament_key, player_key, deck_name or None) + rows[0][5:])
+            counts = {}
+            for deck_type, name, url, code, count, *_ in rows:
+                card_key = self.card_key(deck_type, name, url, code)
+                counts[card_key] = counts.get(card_key, 0) + count
+            tables["fact_deck_card"].extend((tournament_key, player_key, card_key, count)
+                                            for card_key, count in counts.items())
+            if deck_name:
+                summary = self.summary.setdefault((deck_name, ext), [0, 0])
+                summary[0] += wr
+                summary[1] += 1
+                if date is not None:
+                    daily = self.daily_rollup.setdefault((date.date(), ext, deck_name), [0, 0])
+                    daily[0] += 1
+                    daily[1] += wr
+        for (deck_name, opponent), counts in result['matchups'].items():
+            tables["wrk_deck_matchups"].append((tid, deck_name, opponent, ext, *counts))
+            total = self.matchups.setdefault((deck_name, opponent, ext), [0, 0, 0])
+            for i, nb in enumerate(counts):
+                total[i] += nb
+        for sink in self.sinks:
+            sink.add(result, deck_rows)
+        return tables
+
+    # Intègre les tournois transformés au fil de l'eau et produit les lignes de chacun, par table
+    # L'ordre des résultats fixe la numérotation des joueurs
+    def iter_rows(self, results):
+        for result in results:
+            yield self.add(result)
+
+    # Remplace les agrégats par ceux stockés en base (contributions de tous les tournois déjà chargés)
+    def load_aggregates(self, cur):
+        cur.execute("""
+            SELECT card_name, SUM(deck_count) FROM public.wrk_card_usage
+            GROUP BY card_name HAVING SUM(deck_count) > 0
+        """)
+        self.card_deck_counts = defaultdict(int, {nm: int(nb) for nm, nb in cur.fetchall()})
+        cur.execute("""
+            SELECT deck_name, extension_label, SUM(winrate_percent), COUNT(*)
+            FROM public.wrk_deck_archetypes
+            GROUP BY deck_name, extension_label
+        """)
+        self.summary = {(deck_name, ext): [int(wr_sum), cnt] for deck_name, ext, wr_sum, cnt in cur.fetchall()}
+        cur.execute("""
+            SELECT deck_name, opponent_deck_name, extension_label, SUM(win_count), SUM(loss_count), SUM(draw_count)
+            FROM public.wrk_deck_matchups
+            GROUP BY deck_name, opponent_deck_name, extension_label
+        """)
+        self.matchups = {(deck_name, opponent, ext): [int(w), int(l), int(d)]
+                         for deck_name, opponent, ext, w, l, d in cur.fetchall()}
+
+    def card_rows(self) -> list[tuple]:
+        card_usage_map = {nm: int(nb * 100 / max(len(self.card_deck_counts),1))
+                          for nm, nb in self.card_deck_counts.items()}
+        all_cards_rows = []
+        for c in self.index.uniq_cards:
+            nm       = remove_non_encodable(c.get('name',''))
+            u        = card_usage_map.get(nm, 0)
+            lbl_ext  = remove_non_encodable(c.get('extension',''))
+            code_ext = remove_non_encodable(parse_card_code_from_url(c.get('full_url','')))
+            all_cards_rows.append((
+                remove_non_encodable(c.get('full_url','')),
+                nm,
+                remove_non_encodable(c.get('card_type','')),
+                remove_non_encodable(c.get('stage','')),
+                remove_non_encodable(c.get('evolves_from','')),
+                remove_non_encodable(c.get('element_type','')),
+                parse_int(c.get('hp','')),
+                remove_non_encodable(c.get('attack','')),
+                remove_non_encodable(c.get('attack_effect','')),
+                remove_non_encodable(c.get('ability','')),
+                remove_non_encodable(c.get('ability_effect','')),
+                remove_non_encodable(c.get('weakness','')),
+                parse_int(c.get('retreat','')),
+                remove_non_encodable(c.get('illustrator','')),
+                remove_non_encodable(c.get('flavor_text','')),
+                lbl_ext,
+                code_ext,
+                max(0, min(u,100))
+            ))
+        return all_cards_rows
+
+    def dim_extension_rows(self) -> list[tuple]:
+        info = load_extension_info()
+        rows = []
+        for code, key in self.extension_keys.items():
+            name, dt, nb_cards = info.get(code, (None, None, None))
+            rows.append((key, remove_non_encodable(code), remove_non_encodable(name) if name else None,
+                         dt.date() if dt else None, nb_cards))
+        return rows
+
+    def dim_player_rows(self) -> list[tuple]:
+        return [(player_id,) for _, player_id in self.new_users]
+
+    def deck_summary_rows(self) -> list[tuple]:
+        return [(deck_name, ext, int(wr_sum / cnt), cnt)
+                for (deck_name, ext), (wr_sum, cnt) in self.summary.items()]
+
+    def daily_rollup_rows(self) -> list[tuple]:
+        return [(day, ext, deck_name, cnt, wr_sum) for (day, ext, deck_name), (cnt, wr_sum) in self.daily_rollup.items()]
+
+    def deck_matchup_rows(self) -> list[tuple]:
+        return [(deck_name, opponent, ext, w + l + d, w, l, d, int(w * 100 / (w + l or 1)))
+                for (deck_name, opponent, ext), (w, l, d) in self.matchups.items()]
+
+# Collecte les lignes des tournois transformés au format des vues wrk_tournaments et wrk_decklists
+# (voir TransformState.sinks)
+
+class WorkingRows:
+    def __init__(self):
+        self.tournament_rows = []
+        self.decklist_rows = []
+
+    def add(self, result: dict, deck_rows: list[tuple]):
+        self.tournament_rows.append(result['row'])
+        self.decklist_rows.extend(deck_rows)
+
+# Calcule les données à insérer, incluant deck_summary (toutes les lignes en mémoire)
+# Les decklists sont renvoyées au format de la vue wrk_decklists, pas en lignes fact_deck_card
 
 def compute_all_inserts(all_tournaments: list[dict]):
-    wrk_tourn_rows = []
-    wrk_deck_rows = []
-    card_to_decks = defaultdict(set)
-    if not os.path.isfile(json_all_cards):
-        raise FileNotFoundError(f"Fichier all_cards.json introuvable : {json_all_cards}")
-    all_cards_json = json.load(open(json_all_cards, encoding="utf-8"))
-    uniq_cards = {}
-    # Construire maps pour stage et hp
-    stage_map = {}
-    hp_map = {}
-    evolves_map = {}
-    for c in all_cards_json:
-        name = c.get('name','')
-        full_url = c.get('full_url','')
-        ext_code = parse_card_code_from_url(full_url)
-        stage = c.get('stage','')
-        hp_str = c.get('hp','').strip()
-        try:
-            hp_val = int(hp_str)
-        except:
-            hp_val = 0
-        stage_map[(name, ext_code)] = stage
-        hp_map[(name, ext_code)] = hp_val
-        evolves_map[name] = c.get('evolves_from','').strip()
-        key = (name, c.get('attack',''), c.get('extension',''))
-        if key not in uniq_cards:
-            uniq_cards[key] = c
-
-    ext_order = load_extensions()
-
-    tourn_pstats = {}
-    tourn_latest_ext = {}
-    for t in all_tournaments:
-        tid = remove_non_encodable(t.get('id',''))
-        name = remove_non_encodable(t.get('name',''))
-        try:
-            date = datetime.fromisoformat(t.get('date','').replace('Z','+00:00')).replace(tzinfo=None)
-        except:
-            date = None
-        org = remove_non_encodable(t.get('organizer',''))
-        fmt = remove_non_encodable(t.get('format',''))
-        nb  = int(t.get('nb_players', 0))
-
-        # Détermine latest extension pour ce tournoi
-        ext_codes_in_tourn = set(parse_card_code_from_url(c.get('url',''))
-                                for pl in t.get('players',[]) for c in pl.get('decklist', []))
-        latest_ext = ''
-        for code in ext_order:
-            if code in ext_codes_in_tourn:
-                latest_ext = code
-        tourn_latest_ext[tid] = latest_ext
-
-        wrk_tourn_rows.append((tid, name, date, org, fmt, nb))
-
-        pstats = defaultdict(lambda: {'wins':0,'losses':0})
-        for m in t.get('matches', []):
-            res = m.get('match_results', [])
-            if not res:
-                continue
-            scores = [r.get('score', 0) for r in res]
-            maxs = max(scores)
-            if scores.count(maxs) == 1:
-                for r in res:
-                    pid = r.get('player_id','')
-                    if r.get('score',0) == maxs:
-                        pstats[pid]['wins'] += 1
-                    else:
-                        pstats[pid]['losses'] += 1
-        tourn_pstats[tid] = pstats
-
-    user_map = {}
-    next_user_id = 1
-    for t in all_tournaments:
-        tid = remove_non_encodable(t.get('id',''))
-        pstats = tourn_pstats.get(tid, {})
-        for pl in t.get('players', []):
-            orig = pl.get('id','')
-            if orig not in user_map:
-                user_map[orig] = next_user_id
-                next_user_id += 1
-            pid_int = user_map[orig]
-            w = pstats.get(orig, {}).get('wins', 0)
-            l = pstats.get(orig, {}).get('losses', 0)
-            total = w + l or 1
-            wr = int(w * 100 / total)
-
-            for c in pl.get('decklist', []):
-                deck_type = remove_non_encodable(c.get('type',''))
-                url        = remove_non_encodable(c.get('url',''))
-                name_full  = remove_non_encodable(c.get('name',''))
-                code       = remove_non_encodable(parse_card_code_from_url(url))
-
-                wrk_deck_rows.append((
-                    tid, str(pid_int), deck_type,
-                    name_full, url, code, w, l, wr
-                ))
-
-                deck_id = f"{tid}_{orig}"
-                card_to_decks[name_full].add(deck_id)
-
-    card_usage_map = {nm: int(len(ds)*100 / max(len(card_to_decks),1))
-                      for nm, ds in card_to_decks.items()}
-    all_cards_rows = []
-    for c in uniq_cards.values():
-        nm       = remove_non_encodable(c.get('name',''))
-        u        = card_usage_map.get(nm, 0)
-        lbl_ext  = remove_non_encodable(c.get('extension',''))
-        code_ext = remove_non_encodable(parse_card_code_from_url(c.get('full_url','')))
-        all_cards_rows.append((
-            remove_non_encodable(c.get('full_url','')),
-            nm,
-            remove_non_encodable(c.get('card_type','')),
-            remove_non_encodable(c.get('stage','')),
-            remove_non_encodable(c.get('evolves_from','')),
-            remove_non_encodable(c.get('element_type','')),
-            remove_non_encodable(c.get('hp','')),
-            remove_non_encodable(c.get('attack','')),
-            remove_non_encodable(c.get('attack_effect','')),
-            remove_non_encodable(c.get('ability','')),
-            remove_non_encodable(c.get('ability_effect','')),
-            remove_non_encodable(c.get('weakness','')),
-            remove_non_encodable(c.get('retreat','')),
-            remove_non_encodable(c.get('illustrator','')),
-            remove_non_encodable(c.get('flavor_text','')),
-            lbl_ext,
-            code_ext,
-            max(0, min(u,100))
-        ))
-
-    # 4) Préparer deck_summary avec extension distincte
-    stats_summary = {}
-    for t in all_tournaments:
-        tid = remove_non_encodable(t.get('id',''))
-        ext = tourn_latest_ext.get(tid, '')
-        pstats = tourn_pstats.get(tid, {})
-        for pl in t.get('players', []):
-            pid = pl.get('id','')
-            w = pstats.get(pid, {}).get('wins', 0)
-            l = pstats.get(pid, {}).get('losses', 0)
-            total = w + l or 1
-            wr = int(w * 100 / total)
-
-            mons = []
-            for c in pl.get('decklist', []):
-                if c.get('type') != 'Pokémon':
-                    continue
-                nm  = parse_card_name(c.get('name',''))
-                url = c.get('url','')
-                card_ext = parse_card_code_from_url(url)
-                stage_str = stage_map.get((nm, card_ext), '')
-                st = 2 if 'Stage 2' in stage_str else 1 if 'Stage 1' in stage_str else 0
-                hp_val = hp_map.get((nm, card_ext), 0)
-                mons.append((nm, st, hp_val))
-            if not mons:
-                continue
-            # Trier: priorité EX, puis stage décroissant, puis HP décroissant
-            mons_sorted = sorted(
-                mons,
-                key=lambda x: (
-                    0 if x[0].lower().endswith(' ex') else 1,
-                    -x[1],
-                    -x[2]
-                )
-            )
-            key_cards = []
-            for nm, st, hp_val in mons_sorted:
-                conflict = False
-                for sel in key_cards:
-                    if evolves_map.get(nm,'') == sel or evolves_map.get(sel,'') == nm:
-                        conflict = True
-                        break
-                if conflict:
-                    continue
-                key_cards.append(nm)
-                if len(key_cards) == 2:
-                    break
-            if not key_cards:
-                continue
-            key_cards = sorted(key_cards)
-            deck_name = " - ".join(key_cards)
-            summary_key = (deck_name, ext)
-            if summary_key not in stats_summary:
-                stats_summary[summary_key] = {'wrs': [], 'cnt': 0}
-            stats_summary[summary_key]['wrs'].append(wr)
-            stats_summary[summary_key]['cnt'] += 1
-    deck_summary_rows = []
-    for (deck_name, ext), val in stats_summary.items():
-        avg_wr = int(sum(val['wrs']) / len(val['wrs'])) if val['wrs'] else 0
-        deck_summary_rows.append((deck_name, ext, avg_wr, val['cnt']))
-    return wrk_tourn_rows, wrk_deck_rows, all_cards_rows, deck_summary_rows
-
-# Création des tables
-
-def create_tables():
-    ddl = """
-    DROP TABLE IF EXISTS public.wrk_tournaments;
-    CREATE TABLE public.wrk_tournaments (
-      tournament_id VARCHAR,
+    state = TransformState()
+    working = WorkingRows()
+    state.sinks.append(working)
+    results = (transform_tournament(t, state.index, state.classifier) for t in all_tournaments)
+    for _ in state.iter_rows(results):
+        pass
+    return working.tournament_rows, working.decklist_rows, state.card_rows(), state.deck_summary_rows()
+
+# Colonnes de chaque table, dans l'ordre des tuples produits par le pipeline
+
+TABLE_COLUMNS = {
+    "wrk_tournaments": (
+        "tournament_id", "tournament_name", "tournament_date",
+        "tournament_organizer", "tournament_format", "tournament_nb_players",
+    ),
+    "dim_extension": (
+        "extension_key", "extension_code", "extension_name", "release_date", "card_count",
+    ),
+    "dim_tournament": (
+        "tournament_key", "tournament_id", "tournament_name", "tournament_date",
+        "tournament_organizer", "tournament_format", "tournament_nb_players", "extension_key",
+    ),
+    "dim_player": (
+        "player_key",
+    ),
+    "dim_card": (
+        "card_key", "deck_type", "card_name", "card_url", "card_code", "extension_key",
+    ),
+    "fact_deck": (
+        "tournament_key", "player_key", "deck_name", "win_count", "loss_count", "winrate_percent",
+    ),
+    "fact_deck_card": (
+        "tournament_key", "player_key", "card_key", "card_count",
+    ),
+    "all_pokemon_cards": (
+        "full_url", "name", "card_type", "stage", "evolves_from", "element_type",
+        "hp", "attack", "attack_effect", "ability", "ability_effect", "weakness",
+        "retreat", "illustrator", "flavor_text", "extension_label",
+        "extension_code", "usage_percent_set",
+    ),
+    "deck_summary": (
+        "deck_name", "extension_label", "avg_winrate", "presence_count",
+    ),
+    "wrk_card_usage": (
+        "tournament_id", "card_name", "deck_count",
+    ),
+    "wrk_deck_matchups": (
+        "tournament_id", "deck_name", "opponent_deck_name", "extension_label",
+        "win_count", "loss_count", "draw_count",
+    ),
+    "deck_matchups": (
+        "deck_name", "opponent_deck_name", "extension_label", "match_count",
+        "win_count", "loss_count", "draw_count", "winrate_percent",
+    ),
+    "deck_daily_rollup": (
+        "day", "extension_label", "deck_name", "deck_count", "winrate_sum",
+    ),
+    "card_pair_stats": (
+        "extension_label", "card_name_a", "card_name_b", "deck_count",
+        "win_count", "loss_count", "winrate_percent",
+    ),
+    "etl_manifest": (
+        "source", "tournament_id", "mtime_ns", "size", "content_hash",
+    ),
+    "etl_player_map": (
+        "orig_id", "player_id",
+    ),
+}
+
+# Définition des tables
+
+TABLE_DDL = {
+    # Schéma en étoile : dimensions à clé entière, faits étroits ne contenant que des clés et des mesures
+    # Les clés sont stables d'un run incrémental à l'autre (voir TransformState.load_dimensions)
+    "dim_extension": """
+      extension_key SMALLINT PRIMARY KEY,
+      extension_code TEXT NOT NULL UNIQUE,
+      extension_name TEXT,
+      release_date DATE,
+      card_count INT
+    """,
+    # extension_key : dernière extension jouée dans le tournoi
+    "dim_tournament": """
+      tournament_key INT PRIMARY KEY,
+      tournament_id VARCHAR NOT NULL UNIQUE,
       tournament_name VARCHAR,
       tournament_date TIMESTAMP,
       tournament_organizer VARCHAR,
       tournament_format VARCHAR,
-      tournament_nb_players INT
-    );
-
-    DROP TABLE IF EXISTS public.wrk_decklists;
-    CREATE TABLE public.wrk_decklists (
-      tournament_id VARCHAR,
-      player_id VARCHAR,
-      deck_type VARCHAR,
-      card_name VARCHAR,
+      tournament_nb_players INT,
+      extension_key SMALLINT
+    """,
+    # Joueurs anonymes : player_key est le player_id de etl_player_map
+    "dim_player": """
+      player_key INT PRIMARY KEY
+    """,
+    # Cartes telles qu'écrites dans les decklists (une carte inconnue de all_cards.json a sa propre ligne)
+    "dim_card": """
+      card_key INT PRIMARY KEY,
+      deck_type TEXT,
+      card_name TEXT,
       card_url TEXT,
-      card_code VARCHAR,
-      win_count INT,
-      loss_count INT,
-      winrate_percent INT
-    );
-
-    DROP TABLE IF EXISTS public.dwh_cards;
-    CREATE TABLE public.dwh_cards AS
-      SELECT DISTINCT deck_type AS card_type, card_name, card_url
-      FROM public.wrk_decklists;
-
-    DROP TABLE IF EXISTS public.all_pokemon_cards;
-    CREATE TABLE public.all_pokemon_cards (
+      card_code TEXT,
+      extension_key SMALLINT
+    """,
+    # Un deck par joueur et par tournoi, avec les résultats du joueur (deck_name vide si non classé)
+    "fact_deck": """
+      tournament_key INT NOT NULL,
+      player_key INT NOT NULL,
+      deck_name TEXT,
+      win_count SMALLINT,
+      loss_count SMALLINT,
+      winrate_percent SMALLINT
+    """,
+    # Cartes de chaque deck, avec leur nombre d'exemplaires
+    "fact_deck_card": """
+      tournament_key INT NOT NULL,
+      player_key INT NOT NULL,
+      card_key INT NOT NULL,
+      card_count SMALLINT NOT NULL
+    """,
+    "all_pokemon_cards": """
         full_url TEXT,
         name TEXT,
         card_type TEXT,
         stage TEXT,
         evolves_from TEXT,
         element_type TEXT,
-        hp TEXT,
+        hp INT,
         attack TEXT,
         attack_effect TEXT,
         ability TEXT,
         ability_effect TEXT,
         weakness TEXT,
-        retreat TEXT,
+        retreat INT,
         illustrator TEXT,
         flavor_text TEXT,
         extension_label TEXT,
         extension_code TEXT,
         usage_percent_set INT
-    );
-
-    DROP TABLE IF EXISTS public.deck_summary;
-    CREATE TABLE public.deck_summary (
+    """,
+    "deck_summary": """
       deck_name TEXT,
       extension_label TEXT,
       avg_winrate INT,
       presence_count INT,
       PRIMARY KEY (deck_name, extension_label)
-    );
+    """,
+    # Nombre de decks contenant chaque carte, par tournoi : source de usage_percent_set
+    "wrk_card_usage": """
+      tournament_id VARCHAR,
+      card_name VARCHAR,
+      deck_count INT
+    """,
+    # Confrontations entre archétypes de chaque tournoi : source de deck_matchups en mode incrémental
+    "wrk_deck_matchups": """
+      tournament_id VARCHAR,
+      deck_name TEXT,
+      opponent_deck_name TEXT,
+      extension_label TEXT,
+      win_count INT,
+      loss_count INT,
+      draw_count INT
+    """,
+    # Matrice archétype contre archétype par extension, du point de vue de deck_name
+    # (winrate_percent = victoires / (victoires + défaites), un match miroir compte des deux côtés)
+    "deck_matchups": """
+      deck_name TEXT,
+      opponent_deck_name TEXT,
+      extension_label TEXT,
+      match_count INT,
+      win_count INT,
+      loss_count INT,
+      draw_count INT,
+      winrate_percent INT,
+      PRIMARY KEY (deck_name, opponent_deck_name, extension_label)
+    """,
+    # Agrégats additifs par jour, extension et archétype : fusionnés par différence à chaque run
+    # (winrate_sum / deck_count = winrate moyen)
+    "deck_daily_rollup": """
+      day DATE,
+      extension_label TEXT,
+      deck_name TEXT,
+      deck_count INT,
+      winrate_sum BIGINT,
+      PRIMARY KEY (day, extension_label, deck_name)
+    """,
+    # Tendances pour Power BI, recalculées depuis deck_daily_rollup :
+    # period = day, week (lundi à dimanche), 7d ou 30d (fenêtres glissantes finissant à period_end)
+    # share_percent = part des decks classés de l'extension sur la période
+    "deck_trends": """
+      period TEXT,
+      period_start DATE,
+      period_end DATE,
+      extension_label TEXT,
+      deck_name TEXT,
+      deck_count INT,
+      share_percent NUMERIC(5,2),
+      avg_winrate INT,
+      PRIMARY KEY (period, period_start, extension_label, deck_name)
+    """,
+    # Paires de cartes jouées ensemble dans au moins 3 decks d'une extension (voir card_pairs.py)
+    "card_pair_stats": """
+      extension_label TEXT,
+      card_name_a TEXT,
+      card_name_b TEXT,
+      deck_count INT,
+      win_count INT,
+      loss_count INT,
+      winrate_percent INT,
+      PRIMARY KEY (extension_label, card_name_a, card_name_b)
+    """,
+    # Sources déjà traitées et numérotation anonyme des joueurs, conservées entre deux runs
+    # mtime_ns / size : empreinte rapide (position et longueur pour une entrée du fichier compact)
+    "etl_manifest": """
+      source TEXT PRIMARY KEY,
+      tournament_id VARCHAR,
+      mtime_ns BIGINT,
+      size BIGINT,
+      content_hash TEXT
+    """,
+    "etl_player_map": """
+      orig_id VARCHAR PRIMARY KEY,
+      player_id INT
+    """,
+}
+
+# Anciennes tables de travail, devenues des vues sur le schéma en étoile (mêmes colonnes ; wrk_decklists a en
+# plus card_count, en dernière colonne) : les requêtes et le rapport Power BI existants continuent de fonctionner
+VIEWS = {
+    "wrk_tournaments": """
+      SELECT tournament_id, tournament_name, tournament_date, tournament_organizer, tournament_format,
+             tournament_nb_players
+      FROM public.dim_tournament
+    """,
+    "wrk_decklists": """
+      SELECT t.tournament_id, f.player_key::varchar AS player_id, c.deck_type, c.card_name, c.card_url,
+             c.card_code, d.win_count, d.loss_count, d.winrate_percent, f.card_count
+      FROM public.fact_deck_card f
+      JOIN public.dim_tournament t ON t.tournament_key = f.tournament_key
+      JOIN public.dim_card c ON c.card_key = f.card_key
+      JOIN public.fact_deck d ON d.tournament_key = f.tournament_key AND d.player_key = f.player_key
+    """,
+    # Archétype de chaque joueur de chaque tournoi : source de deck_summary en mode incrémental
+    "wrk_deck_archetypes": """
+      SELECT t.tournament_id, d.player_key::varchar AS player_id, d.deck_name,
+             COALESCE(e.extension_code, '') AS extension_label, d.winrate_percent
+      FROM public.fact_deck d
+      JOIN public.dim_tournament t ON t.tournament_key = d.tournament_key
+      LEFT JOIN public.dim_extension e ON e.extension_key = t.extension_key
+      WHERE d.deck_name IS NOT NULL
+    """,
+    "dwh_cards": """
+      SELECT deck_type AS card_type, card_name, card_url
+      FROM public.dim_card
+    """,
+}
+
+# Tables contenant des lignes par tournoi, à purger quand un tournoi est rechargé
+TOURNAMENT_TABLES = ("wrk_card_usage", "wrk_deck_matchups")
+# Tables alimentées tournoi par tournoi (voir TransformState.add et copy_batches)
+STREAMED_TABLES = ("dim_tournament", "fact_deck", "fact_deck_card", "wrk_card_usage", "wrk_deck_matchups")
+# Nombre de tournois envoyés par lot de COPY
+COPY_BATCH_SIZE = 500
+# Tables de faits, purgées par clé de tournoi
+FACT_TABLES = ("fact_deck", "fact_deck_card")
+
+# Type d'une relation du schéma public : 'r' table, 'v' vue, None si absente
+
+def relation_kind(cur, name: str) -> str | None:
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (f"public.{name}",))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+# Suppression des vues, ou des anciennes tables du même nom
+
+def drop_views(cur):
+    for view in VIEWS:
+        kind = relation_kind(cur, view)
+        if kind is not None:
+            cur.execute(f"DROP {'VIEW' if kind == 'v' else 'TABLE'} public.{view};")
+
+# Création des tables (supprime les données existantes)
+
+def create_tables(cur):
+    drop_views(cur)
+    for table, columns in TABLE_DDL.items():
+        cur.execute(f"DROP TABLE IF EXISTS public.{table};")
+        cur.execute(f"CREATE TABLE public.{table} ({columns});")
+    for view, query in VIEWS.items():
+        cur.execute(f"CREATE VIEW public.{view} AS {query};")
+
+# Création des tables manquantes (mode incrémental, conserve les données)
+# Une base dont wrk_decklists est encore une table n'a pas de schéma en étoile : il faut un run complet
+# Les autres tables devenues des vues ne contiennent que des copies du schéma en étoile : elles sont remplacées
+# Les vues sont recréées : CREATE OR REPLACE VIEW ne peut pas changer l'ordre de leurs colonnes
+
+def ensure_tables(cur):
+    if relation_kind(cur, "wrk_decklists") == 'r':
+        raise RuntimeError("Base créée avant le schéma en étoile : lancez un run complet (sans --incremental)")
+    drop_views(cur)
+    for table, columns in TABLE_DDL.items():
+        cur.execute(f"CREATE TABLE IF NOT EXISTS public.{table} ({columns});")
+    for view, query in VIEWS.items():
+        cur.execute(f"CREATE VIEW public.{view} AS {query};")
+
+# Index créés après le chargement initial
+# Tables de travail : purge d'un tournoi. Faits : les lignes sont écrites dans l'ordre des tournois,
+# un index BRIN sur tournament_key (quelques pages) suffit pour purger ou filtrer une plage de tournois ;
+# B-tree pour les recherches par carte, par joueur et pour la jointure fact_deck_card -> fact_deck.
+
+def create_indexes(cur):
+    for table in TOURNAMENT_TABLES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_tournament_idx ON public.{table} (tournament_id);")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS dim_tournament_date_brin ON public.dim_tournament USING brin (tournament_date);
+        CREATE INDEX IF NOT EXISTS dim_card_extension_idx ON public.dim_card (extension_key);
+        CREATE INDEX IF NOT EXISTS fact_deck_card_tournament_brin ON public.fact_deck_card USING brin (tournament_key);
+        CREATE INDEX IF NOT EXISTS fact_deck_card_card_idx ON public.fact_deck_card (card_key);
+        CREATE INDEX IF NOT EXISTS fact_deck_deck_idx ON public.fact_deck (tournament_key, player_key);
+        CREATE INDEX IF NOT EXISTS fact_deck_player_idx ON public.fact_deck (player_key);
+    """)
+
+# Chargement en masse d'une table via COPY FROM STDIN
+# Les lignes sont envoyées au fil de l'eau, sans liste intermédiaire
+
+def write_rows(cur, table: str, rows, target: str = None) -> int:
+    columns = ", ".join(TABLE_COLUMNS[table])
+    nb_rows = 0
+    with cur.copy(f"COPY {target or 'public.' + table} ({columns}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            nb_rows += 1
+    return nb_rows
+
+def print_copy(table: str, nb_rows: int, elapsed: float):
+    rate = nb_rows / elapsed if elapsed > 0 else 0
+    print(f"   {table} : {nb_rows} lignes en {elapsed:.2f}s ({rate:,.0f} lignes/s)")
+    profiler.add_rows(nb_rows)
+
+def copy_rows(cur, table: str, rows, target: str = None) -> int:
+    start = time.perf_counter()
+    nb_rows = write_rows(cur, table, rows, target)
+    print_copy(table, nb_rows, time.perf_counter() - start)
+    return nb_rows
+
+# Chargement des lignes produites tournoi par tournoi : tables -> lignes de chaque tournoi
+# Une connexion n'a qu'une COPY en cours à la fois : les tournois sont envoyés par lots de COPY_BATCH_SIZE,
+# une COPY par table et par lot. La mémoire dépend de la taille d'un lot, pas de celle de l'archive.
+
+def copy_batches(cur, tournament_rows, tables: tuple):
+    nb_rows = dict.fromkeys(tables, 0)
+    elapsed = dict.fromkeys(tables, 0.0)
+    tournament_rows = iter(tournament_rows)
+    while batch := list(islice(tournament_rows, COPY_BATCH_SIZE)):
+        for table in tables:
+            start = time.perf_counter()
+            nb_rows[table] += write_rows(cur, table, chain.from_iterable(rows[table] for rows in batch))
+            elapsed[table] += time.perf_counter() - start
+    for table in tables:
+        print_copy(table, nb_rows[table], elapsed[table])
+
+# Manifeste : source -> (tournament_id, mtime_ns, size, content_hash)
+
+def load_manifest(cur) -> dict:
+    cur.execute("SELECT source, tournament_id, mtime_ns, size, content_hash FROM public.etl_manifest")
+    return {source: rest for source, *rest in cur.fetchall()}
+
+def load_player_map(cur) -> dict:
+    cur.execute("SELECT orig_id, player_id FROM public.etl_player_map")
+    return dict(cur.fetchall())
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+# Compare les fichiers présents au manifeste
+# Renvoie les fichiers nouveaux ou modifiés, les sources dont seule la date a changé,
+# et les sources disparues du disque
+
+def diff_manifest(manifest: dict):
+    changed, touched = [], []
+    present = set()
+    for source in list_tournament_sources():
+        name = source_name(source)
+        present.add(name)
+        known = manifest.get(name)
+        stat = source_stat(source)
+        if known is not None and (known[1], known[2]) == stat:
+            continue
+        if known is not None:
+            try:
+                digest = file_digest(read_source(source))
+            except (OSError, ValueError):
+                digest = None
+            if digest == known[3]:
+                touched.append((name, known[0], *stat, digest))
+                continue
+        changed.append(source)
+    removed = [source for source in manifest if source not in present]
+    return changed, touched, removed
+
+# Contexte des processus de transformation, fixé une fois par processus
+
+_worker_index = None
+_worker_classifier = None
+
+def init_worker(index: CardIndex, classifier: DeckClassifier = None):
+    global _worker_index, _worker_classifier
+    _worker_index = index
+    _worker_classifier = classifier if classifier is not None else DeckClassifier(index)
+
+# Lit une source de tournoi
+# Renvoie (ligne du manifeste sans tournament_id, tournoi), ou None si la source est illisible
+
+def load_source(source):
+    try:
+        stat = source_stat(source)
+        data = read_source(source)
+    except (OSError, ValueError):
+        return None
+    t = decode_source(source, data)
+    if t is None:
+        return None
+    return (source_name(source), *stat, file_digest(data)), t
+
+# Lit et transforme une source de tournoi
+# Renvoie (ligne du manifeste, tournoi transformé), ou None si la source est illisible
+
+def transform_source(source):
+    loaded = load_source(source)
+    if loaded is None:
+        return None
+    (name, *fingerprint), t = loaded
+    result = transform_tournament(t, _worker_index, _worker_classifier)
+    return (name, result['id'], *fingerprint), result
+
+# Lit et transforme un lot de sources avec le moteur vectorisé
+# Renvoie la liste des (ligne du manifeste, tournoi transformé) des sources lisibles
+
+def transform_sources(sources: list):
+    loaded = [res for res in map(load_source, sources) if res is not None]
+    results = transform_batch([t for _, t in loaded], _worker_index, _worker_classifier)
+    return [((name, result['id'], *fingerprint), result)
+            for ((name, *fingerprint), _), result in zip(loaded, results)]
+
+# Équivalent de executor.map, avec au plus `window` tournois en cours ou en attente de lecture
+
+def ordered_map(executor, fn, items, window: int):
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Nombre de tournois par lot du moteur numpy
+ENGINE_BATCH_SIZE = 256
+
+# Transforme les sources, en parallèle si workers > 1
+# Les résultats sont rendus dans l'ordre des sources : la fusion est identique au run séquentiel
+# engine "numpy" : les sources sont transformées par lots avec le moteur vectorisé (voir analytics.py)
+# Produit les (ligne du manifeste, tournoi transformé) des sources lisibles
+
+def iter_transformed(sources: list, state: TransformState, workers: int = 1, engine: str = "python"):
+    if engine == "numpy":
+        fn, items, window = transform_sources, [sources[i:i + ENGINE_BATCH_SIZE] for i in range(0, len(sources), ENGINE_BATCH_SIZE)], workers * 2
+    else:
+        fn, items, window = transform_source, sources, workers * 4
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=init_worker,
+                                 initargs=(state.index,)) as executor:
+            results = ordered_map(executor, fn, items, window)
+            if engine == "numpy":
+                results = chain.from_iterable(results)
+            yield from (res for res in results if res is not None)
+    else:
+        init_worker(state.index, state.classifier)
+        results = map(fn, items)
+        if engine == "numpy":
+            results = chain.from_iterable(results)
+        yield from (res for res in results if res is not None)
+
+# Lignes de chaque tournoi transformé, par table, avec sa ligne du manifeste
+
+def iter_tournament_rows(state: TransformState, transformed):
+    for manifest_row, result in transformed:
+        tables = state.add(result)
+        tables["etl_manifest"] = [manifest_row]
+        yield tables
+
+# Supprime toutes les lignes des tournois donnés
+
+def delete_tournaments(cur, tournament_ids: list[str]):
+    if not tournament_ids:
+        return
+    for table in FACT_TABLES:
+        cur.execute(f"""
+            DELETE FROM public.{table} WHERE tournament_key IN
+              (SELECT tournament_key FROM public.dim_tournament WHERE tournament_id = ANY(%s))
+        """, (tournament_ids,))
+    for table in TOURNAMENT_TABLES + ("dim_tournament",):
+        cur.execute(f"DELETE FROM public.{table} WHERE tournament_id = ANY(%s)", (tournament_ids,))
+
+# Tendances du métagame
+# deck_daily_rollup ne contient que des sommes : un run incrémental retire la contribution des tournois
+# rechargés ou supprimés, puis ajoute celle des tournois transformés, sans relire l'historique.
+# deck_trends (jours, semaines, fenêtres glissantes) est ensuite recalculée depuis ce petit agrégat.
+
+ROLLUP_UPSERT = """
+    ON CONFLICT (day, extension_label, deck_name) DO UPDATE
+    SET deck_count = deck_daily_rollup.deck_count + EXCLUDED.deck_count,
+        winrate_sum = deck_daily_rollup.winrate_sum + EXCLUDED.winrate_sum
+"""
+
+# Contribution des archétypes stockés, avec le signe donné, limitée aux tournois donnés si tournament_ids
+def rollup_from_archetypes(sign: int, tournament_ids: bool) -> str:
+    return f"""
+        INSERT INTO public.deck_daily_rollup (day, extension_label, deck_name, deck_count, winrate_sum)
+        SELECT t.tournament_date::date, a.extension_label, a.deck_name, {sign} * COUNT(*), {sign} * SUM(a.winrate_percent)
+        FROM public.wrk_deck_archetypes a
+        JOIN public.wrk_tournaments t ON t.tournament_id = a.tournament_id
+        WHERE t.tournament_date IS NOT NULL {"AND a.tournament_id = ANY(%s)" if tournament_ids else ""}
+        GROUP BY 1, 2, 3
+        {ROLLUP_UPSERT}
     """
-    with psycopg.connect(get_conn_str()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SET NAMES 'UTF8';")
-            cur.execute(ddl)
 
-# Exécution principale
+# Base existante sans agrégat journalier : il est construit une fois depuis les tables de travail
+def bootstrap_rollup(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM public.deck_daily_rollup)")
+    if not cur.fetchone()[0]:
+        cur.execute(rollup_from_archetypes(1, False))
 
-if __name__ == "__main__":
-    print("1) Chargement des tournois…")
-    all_tourn = load_all_tournaments()
+def subtract_rollup(cur, tournament_ids: list[str]):
+    if tournament_ids:
+        cur.execute(rollup_from_archetypes(-1, True), (tournament_ids,))
 
-    print("2) Calcul des données…")
-    wrk_tourn_rows, wrk_deck_rows, all_cards_rows, deck_summary_rows = compute_all_inserts(all_tourn)
+def merge_rollup(cur, rows: list[tuple]):
+    cur.execute("CREATE TEMP TABLE tmp_deck_daily_rollup (LIKE public.deck_daily_rollup) ON COMMIT DROP;")
+    copy_rows(cur, "deck_daily_rollup", rows, target="tmp_deck_daily_rollup")
+    cur.execute(f"""
+        INSERT INTO public.deck_daily_rollup SELECT * FROM tmp_deck_daily_rollup
+        {ROLLUP_UPSERT}
+    """)
+    cur.execute("DELETE FROM public.deck_daily_rollup WHERE deck_count <= 0;")
 
-    print("3) Création des tables…")
-    create_tables()
+def refresh_trends(cur):
+    cur.execute("TRUNCATE public.deck_trends;")
+    cur.execute("""
+        WITH periods AS (
+            SELECT 'day' AS period, day AS period_start, day AS period_end,
+                   extension_label, deck_name, deck_count, winrate_sum
+            FROM public.deck_daily_rollup
+            UNION ALL
+            SELECT 'week', date_trunc('week', day)::date, date_trunc('week', day)::date + 6,
+                   extension_label, deck_name, deck_count, winrate_sum
+            FROM public.deck_daily_rollup
+            UNION ALL
+            SELECT w.period, d.day - (w.days - 1), d.day, r.extension_label, r.deck_name, r.deck_count, r.winrate_sum
+            FROM (VALUES ('7d', 7), ('30d', 30)) AS w(period, days)
+            CROSS JOIN (SELECT DISTINCT day, extension_label FROM public.deck_daily_rollup) d
+            JOIN public.deck_daily_rollup r
+              ON r.extension_label = d.extension_label AND r.day BETWEEN d.day - (w.days - 1) AND d.day
+        ),
+        grouped AS (
+            SELECT period, period_start, period_end, extension_label, deck_name,
+                   SUM(deck_count) AS deck_count, SUM(winrate_sum) AS winrate_sum
+            FROM periods
+            GROUP BY period, period_start, period_end, extension_label, deck_name
+        )
+        INSERT INTO public.deck_trends
+        SELECT period, period_start, period_end, extension_label, deck_name, deck_count,
+               round(deck_count * 100.0 / SUM(deck_count) OVER (PARTITION BY period, period_start, extension_label), 2),
+               div(winrate_sum, deck_count)
+        FROM grouped
+    """)
 
-    print("4a) Insertion wrk_tournaments…")
-    sql_t = "INSERT INTO public.wrk_tournaments VALUES (%s,%s,%s,%s,%s,%s)"
-    with psycopg.connect(get_conn_str()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SET NAMES 'UTF8';")
-            cur.executemany(sql_t, wrk_tourn_rows)
+# Chargement PostgreSQL : run complet (recrée tout) ou incrémental
 
-    print("4b) Insertion wrk_decklists…")
-    sql_d = "INSERT INTO public.wrk_decklists VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)"
+def load_database(index: CardIndex, incremental: bool, workers: int, sinks: list, engine: str = "python",
+                  pairs: CardPairStats = None) -> TransformState:
+    # Une seule connexion et une seule transaction pour tout le run :
+    # en cas d'erreur, la base reste dans son état précédent
     with psycopg.connect(get_conn_str()) as conn:
         with conn.cursor() as cur:
             cur.execute("SET NAMES 'UTF8';")
-            cur.executemany(sql_d, wrk_deck_rows)
 
-    print("4c) Insertion all_pokemon_cards…")
-    sql_c = "INSERT INTO public.all_pokemon_cards VALUES (" + ",".join(["%s"]*18) + ")"
-    with psycopg.connect(get_conn_str()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SET NAMES 'UTF8';")
-            cur.executemany(sql_c, all_cards_rows)
+            if incremental:
+                print("2) Comparaison avec le manifeste…")
+                with profiler.stage("prepare"):
+                    ensure_tables(cur)
+                    manifest = load_manifest(cur)
+                    changed, touched, removed = diff_manifest(manifest)
+                    print(f"   {len(changed)} fichiers nouveaux ou modifiés, {len(removed)} supprimés")
+                    stale = [manifest[s][0] for s in removed]
+                    stale += [manifest[source_name(src)][0] for src in changed if source_name(src) in manifest]
+                    bootstrap_rollup(cur)
+                    subtract_rollup(cur, stale)
+                    delete_tournaments(cur, stale)
+                    forget = removed + [s for s, *_ in touched] + [source_name(src) for src in changed]
+                    cur.execute("DELETE FROM public.etl_manifest WHERE source = ANY(%s)", (forget,))
+                    state = TransformState(index, user_map=load_player_map(cur))
+                    state.load_dimensions(cur)
+                    state.sinks.extend(sinks)
+            else:
+                print("2) Création des tables…")
+                with profiler.stage("prepare"):
+                    create_tables(cur)
+                    changed, touched = list_tournament_sources(), []
+                    state = TransformState(index)
+                    state.sinks.extend(sinks)
+            # En run complet, les decks sont collectés au fil de l'eau pour card_pair_stats
+            if pairs is not None and not incremental:
+                state.sinks.append(pairs)
 
-    print("4d) Insertion deck_summary…")
-    sql_s = "INSERT INTO public.deck_summary VALUES (%s,%s,%s,%s)"
-    with psycopg.connect(get_conn_str()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SET NAMES 'UTF8';")
-            cur.executemany(sql_s, deck_summary_rows)
+            # Les tournois sont lus, transformés et envoyés à COPY par lots (voir copy_batches) :
+            # la mémoire dépend des agrégats, des dimensions et de la taille d'un lot, pas de celle de l'archive
+            print("3) Transformation et insertion des tournois, decks et decklists (COPY)…")
+            with profiler.stage("facts"):
+                if touched:
+                    copy_rows(cur, "etl_manifest", touched)
+                results = profiler.iterate("read_transform", iter_transformed(changed, state, workers, engine))
+                copy_batches(cur, iter_tournament_rows(state, results), STREAMED_TABLES + ("etl_manifest",))
+
+            print("4) Insertion des dimensions et des tables agrégées (COPY)…")
+            with profiler.stage("dimensions"):
+                copy_rows(cur, "dim_player", state.dim_player_rows())
+                copy_rows(cur, "dim_card", state.new_cards)
+                if incremental:
+                    cur.execute("TRUNCATE public.dim_extension;")
+                copy_rows(cur, "dim_extension", state.dim_extension_rows())
+                copy_rows(cur, "etl_player_map", state.new_users)
+            with profiler.stage("indexes"):
+                create_indexes(cur)
+
+            # En incrémental, les agrégats viennent des contributions stockées de tous les tournois
+            with profiler.stage("aggregates"):
+                if incremental:
+                    state.load_aggregates(cur)
+                    cur.execute("TRUNCATE public.all_pokemon_cards, public.deck_summary, public.deck_matchups;")
+                copy_rows(cur, "all_pokemon_cards", state.card_rows())
+                copy_rows(cur, "deck_summary", state.deck_summary_rows())
+                copy_rows(cur, "deck_matchups", state.deck_matchup_rows())
+                merge_rollup(cur, state.daily_rollup_rows())
+                refresh_trends(cur)
+
+            if pairs is not None:
+                print("5) Paires de cartes (card_pair_stats)…")
+                with profiler.stage("card_pairs"):
+                    if incremental:
+                        cur.execute("TRUNCATE public.card_pair_stats;")
+                        pairs.load(conn)
+                    copy_rows(cur, "card_pair_stats", pairs.rows())
+        with profiler.stage("commit"):
+            conn.commit()
+    return state
+
+# Run complet (recrée tout) ou incrémental (seulement les fichiers nouveaux ou modifiés),
+# avec export Parquet optionnel
+
+def run(incremental: bool = False, workers: int = 1, parquet_dir: str = None, use_db: bool = True,
+        engine: str = "python", card_pairs: bool = False):
+    if engine == "numpy":
+        require_numpy()
+    print("1) Chargement de l'index des cartes…")
+    with profiler.stage("card_index"):
+        index = CardIndex.load()
+    exporter = ParquetExporter(parquet_dir) if parquet_dir else None
+    sinks = [exporter] if exporter else []
+    pairs = CardPairStats() if card_pairs else None
 
+    if use_db:
+        state = load_database(index, incremental, workers, sinks, engine, pairs)
+    else:
+        print("2) Transformation des tournois…")
+        with profiler.stage("facts"):
+            state = TransformState(index)
+            state.sinks.extend(sinks)
+            results = profiler.iterate("read_transform", iter_transformed(list_tournament_sources(), state, workers, engine))
+            results = (result for _, result in results)
+            profiler.add_rows(sum(len(tables["fact_deck_card"]) for tables in state.iter_rows(results)))
+
+    if exporter:
+        print(f"6) Export Parquet vers {parquet_dir}…")
+        with profiler.stage("parquet"):
+            exporter.finish(state)
+
+    if workers <= 1:
+        info = state.classifier.cache_info()
+        print(f"   archétypes : {info.misses} calculés, {info.hits} servis par le cache")
     print("Fini !")
+
+# Exécution principale
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transformation des tournois et chargement dans PostgreSQL")
+    parser.add_argument("--incremental", action="store_true",
+                        help="ne traite que les fichiers nouveaux ou modifiés depuis le dernier run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="nombre de processus pour lire et transformer les tournois (0 = un par cœur)")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python",
+                        help="moteur de calcul des statistiques (numpy : calcul vectorisé par lots de tournois)")
+    parser.add_argument("--card-pairs", action="store_true",
+                        help="calcule aussi card_pair_stats, les paires de cartes jouées ensemble (nécessite scipy)")
+    parser.add_argument("--parquet", metavar="DOSSIER",
+                        help="exporte aussi les tables en Parquet partitionné dans ce dossier")
+    parser.add_argument("--no-db", action="store_true",
+                        help="n'écrit pas dans PostgreSQL (avec --parquet)")
+    parser.add_argument("--profile", action="store_true",
+                        help="mesure chaque étape (temps réel et CPU, lignes, pic mémoire) et ajoute le rapport JSON "
+                             f"à {profile_report_file}")
+    parser.add_argument("--profile-report", metavar="FICHIER", default=profile_report_file,
+                        help="historique des rapports --profile (JSON lines)")
+    parser.add_argument("--profile-stage", choices=PROFILE_STAGES,
+                        help="profile aussi cette étape fonction par fonction (implique --profile ; avec --workers, "
+                             "read_transform ne voit que le processus principal)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="outil utilisé pour --profile-stage (pyinstrument doit être installé)")
+    args = parser.parse_args()
+    if args.no_db and not args.parquet:
+        parser.error("--no-db n'a de sens qu'avec --parquet")
+    if args.card_pairs and args.no_db:
+        parser.error("card_pair_stats est une table PostgreSQL, --card-pairs est incompatible avec --no-db")
+    if args.incremental and (args.parquet or args.no_db):
+        parser.error("l'export Parquet nécessite un run complet (sans --incremental)")
+    workers = args.workers or os.cpu_count() or 1
+    if args.profile or args.profile_stage:
+        profiler.enable(args.profile_stage, args.profiler)
+    run(incremental=args.incremental, workers=workers,
+        parquet_dir=args.parquet, use_db=not args.no_db, engine=args.engine, card_pairs=args.card_pairs)
+    if profiler.enabled:
+        profiler.write_report(args.profile_report, {
+            "incremental": args.incremental, "workers": workers, "engine": args.engine,
+            "card_pairs": args.card_pairs, "parquet": args.parquet is not None, "db": not args.no_db,
+        })
@@ -0,0 +1,105 @@
+import os
+import shutil
+
+# Export Parquet des tables de travail, en plus (ou à la place) de PostgreSQL
+# Chaque table est un dataset partitionné (format Hive) : extension_code=A3/tournament_month=2025-05/…
+# Les colonnes texte sont encodées en dictionnaire, les partitions ne sont lues que si nécessaire
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+# Colonnes de chaque table exportée ; les colonnes de partition sont ajoutées en fin de ligne
+EXPORT_COLUMNS = {
+    "wrk_tournaments": (
+        "tournament_id", "tournament_name", "tournament_date",
+        "tournament_organizer", "tournament_format", "tournament_nb_players",
+    ),
+    "wrk_decklists": (
+        "tournament_id", "player_id", "deck_type", "card_name", "card_url",
+        "card_code", "win_count", "loss_count", "winrate_percent", "card_count",
+    ),
+    "all_pokemon_cards": (
+        "full_url", "name", "card_type", "stage", "evolves_from", "element_type",
+        "hp", "attack", "attack_effect", "ability", "ability_effect", "weakness",
+        "retreat", "illustrator", "flavor_text", "extension_label",
+    ),
+    "deck_summary": (
+        "deck_name", "avg_winrate", "presence_count",
+    ),
+}
+
+PARTITIONS = {
+    "wrk_tournaments": ("extension_code", "tournament_month"),
+    "wrk_decklists": ("extension_code", "tournament_month"),
+    "all_pokemon_cards": ("extension_code",),
+    "deck_summary": ("extension_label",),
+}
+
+INT_COLUMNS = {"tournament_nb_players", "card_count", "win_count", "loss_count", "winrate_percent",
+               "hp", "retreat", "usage_percent_set", "avg_winrate", "presence_count"}
+
+class ParquetExporter:
+    def __init__(self, root: str, batch_size: int = 500_000):
+        if pa is None:
+            raise RuntimeError("L'export Parquet nécessite pyarrow (pip install pyarrow)")
+        self.root = root
+        self.batch_size = batch_size
+        self.buffers = {"wrk_tournaments": [], "wrk_decklists": []}
+        self.batch_numbers = {table: 0 for table in PARTITIONS}
+        for table in PARTITIONS:
+            shutil.rmtree(os.path.join(root, table), ignore_errors=True)
+
+    # Reçoit chaque tournoi transformé (voir TransformState.sinks)
+    def add(self, result: dict, deck_rows: list[tuple]):
+        date = result['row'][2]
+        partition = (result['extension'] or None, date.strftime("%Y-%m") if date else None)
+        self.buffers["wrk_tournaments"].append(result['row'] + partition)
+        decklists = self.buffers["wrk_decklists"]
+        decklists.extend(row + partition for row in deck_rows)
+        if len(decklists) >= self.batch_size:
+            self.flush("wrk_decklists")
+
+    # Écrit les tampons restants et les tables agrégées
+    def finish(self, state):
+        self.flush("wrk_tournaments")
+        self.flush("wrk_decklists")
+        # all_pokemon_cards : la colonne extension_code sert de partition
+        cards = [row[:16] + (row[17], row[16] or None) for row in state.card_rows()]
+        self.write("all_pokemon_cards", cards, EXPORT_COLUMNS["all_pokemon_cards"] + ("usage_percent_set",))
+        summary = [(deck_name, avg, cnt, ext or None) for deck_name, ext, avg, cnt in state.deck_summary_rows()]
+        self.write("deck_summary", summary, EXPORT_COLUMNS["deck_summary"])
+
+    def flush(self, table: str):
+        rows = self.buffers[table]
+        if rows:
+            self.write(table, rows, EXPORT_COLUMNS[table])
+            rows.clear()
+
+    def write(self, table: str, rows: list[tuple], columns: tuple):
+        partitions = PARTITIONS[table]
+        names = columns + partitions
+        arrays = []
+        for i, name in enumerate(names):
+            values = [row[i] for row in rows]
+            if name in INT_COLUMNS:
+                arrays.append(pa.array(values, type=pa.int32()))
+            elif name in partitions:
+                arrays.append(pa.array(values, type=pa.string()))
+            elif name == "tournament_date":
+                arrays.append(pa.array(values, type=pa.timestamp("s")))
+            else:
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        batch = self.batch_numbers[table]
+        self.batch_numbers[table] += 1
+        ds.write_dataset(
+            pa.Table.from_arrays(arrays, names=list(names)),
+            os.path.join(self.root, table),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([(p, pa.string()) for p in partitions]), flavor="hive"),
+            basename_template=f"part-{batch}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
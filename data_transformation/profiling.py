@@ -0,0 +1,244 @@
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from pyinstrument import Profiler as Pyinstrument
+except ImportError:
+    Pyinstrument = None
+
+# Instrumentation du run de transformation (--profile)
+# Chaque étape mesure son temps réel, son temps CPU (processus principal), les lignes qu'elle produit et le pic
+# de mémoire résidente atteint pendant l'étape : sous Linux le pic est remis à zéro au début de chaque étape
+# (/proc/self/clear_refs), ailleurs c'est le pic du processus depuis son démarrage.
+# Une étape peut en plus être profilée fonction par fonction (cProfile ou pyinstrument).
+# Le rapport de chaque run est ajouté à un historique JSON lines et comparé au run précédent de mêmes options.
+
+# Pic de mémoire résidente en Mo : depuis la dernière remise à zéro, sinon depuis le démarrage du processus
+
+def read_peak_rss() -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def max_or_none(*values):
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+class StageStats:
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.peak_rss_mb = None
+
+    def as_dict(self) -> dict:
+        return {"stage": self.name, "depth": self.depth, "wall": round(self.wall, 4), "cpu": round(self.cpu, 4),
+                "rows": self.rows, "peak_rss_mb": round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None}
+
+class StageProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.stack = []
+        self.target = None
+        self.tool = "cprofile"
+        self.profiler = None
+        self.per_stage_peak = False
+        self.start = None
+
+    # target : étape à profiler fonction par fonction, tool : cprofile ou pyinstrument
+    def enable(self, target: str = None, tool: str = "cprofile"):
+        if target is not None and tool == "pyinstrument" and Pyinstrument is None:
+            raise RuntimeError("--profiler pyinstrument nécessite pyinstrument (pip install pyinstrument)")
+        self.enabled = True
+        self.target = target
+        self.tool = tool
+        self.per_stage_peak = reset_peak_rss()
+        self.start = (time.perf_counter(), time.process_time())
+
+    def stats(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, len(self.stack))
+        return self.stages[name]
+
+    def start_target(self, name: str):
+        if name != self.target:
+            return
+        if self.profiler is None:
+            self.profiler = cProfile.Profile() if self.tool == "cprofile" else Pyinstrument()
+        if self.tool == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop_target(self, name: str):
+        if name != self.target:
+            return
+        if self.tool == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+    # Étape du run ; les étapes peuvent s'imbriquer, le pic d'une étape englobe celui des étapes qu'elle contient
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        stats = self.stats(name)
+        if self.stack:
+            parent = self.stack[-1]
+            parent.peak_rss_mb = max_or_none(parent.peak_rss_mb, read_peak_rss())
+        if self.per_stage_peak:
+            reset_peak_rss()
+        self.stack.append(stats)
+        self.start_target(name)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += time.process_time() - cpu
+            self.stop_target(name)
+            self.stack.pop()
+            stats.peak_rss_mb = max_or_none(stats.peak_rss_mb, read_peak_rss())
+            if self.stack:
+                self.stack[-1].peak_rss_mb = max_or_none(self.stack[-1].peak_rss_mb, stats.peak_rss_mb)
+
+    # Lignes produites par l'étape en cours (voir copy_rows)
+    def add_rows(self, nb: int):
+        if self.enabled and self.stack:
+            self.stack[-1].rows += nb
+
+    # Temps passé à produire les éléments d'un itérable consommé par l'étape en cours (lecture et transformation
+    # des tournois pendant leur COPY, par exemple) ; rows : nombre d'éléments
+    def iterate(self, name: str, iterable):
+        if not self.enabled:
+            yield from iterable
+            return
+        stats = self.stats(name)
+        iterator = iter(iterable)
+        while True:
+            self.start_target(name)
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stats.wall += time.perf_counter() - wall
+                stats.cpu += time.process_time() - cpu
+                self.stop_target(name)
+            stats.rows += 1
+            yield item
+
+    def report(self, options: dict) -> dict:
+        wall, cpu = self.start
+        return {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "options": options,
+            "wall": round(time.perf_counter() - wall, 4),
+            "cpu": round(time.process_time() - cpu, 4),
+            "peak_scope": "stage" if self.per_stage_peak else "process",
+            "stages": [stats.as_dict() for stats in self.stages.values()],
+        }
+
+    # Écrit le profil détaillé de l'étape ciblée à côté de l'historique ; renvoie le chemin du fichier
+    def write_target_profile(self, directory: str) -> str | None:
+        if self.profiler is None:
+            return None
+        if self.tool == "cprofile":
+            path = os.path.join(directory, f"profile_{self.target}.prof")
+            self.profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(25)
+            print(out.getvalue())
+        else:
+            path = os.path.join(directory, f"profile_{self.target}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+            print(self.profiler.output_text())
+        return path
+
+    # Ajoute le rapport du run à l'historique et l'affiche, comparé au dernier run de mêmes options
+    def write_report(self, path: str, options: dict) -> dict:
+        report = self.report(options)
+        directory = os.path.dirname(os.path.abspath(path))
+        if self.target is not None:
+            report["profile"] = {"stage": self.target, "tool": self.tool,
+                                 "file": self.write_target_profile(directory)}
+        previous = previous_report(path, options)
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+        print_report(report, previous)
+        return report
+
+def previous_report(path: str, options: dict) -> dict | None:
+    if not os.path.isfile(path):
+        return None
+    previous = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            if report.get("options") == options:
+                previous = report
+    return previous
+
+# Écart en % avec le run précédent ; « ! » au-delà de 20 % plus lent (et plus de 50 ms)
+
+def delta(value: float, before: float | None) -> str:
+    if before is None:
+        return ""
+    if before == 0:
+        return "    n/a"
+    change = (value - before) * 100 / before
+    flag = " !" if change > 20 and value - before > 0.05 else ""
+    return f"{change:+7.1f}%{flag}"
+
+def print_report(report: dict, previous: dict | None):
+    before = {s["stage"]: s for s in previous["stages"]} if previous else {}
+    scope = "par étape" if report["peak_scope"] == "stage" else "du processus"
+    print(f"Profil du run (pic mémoire {scope}) :")
+    print(f"   {'étape':<18} {'réel':>9} {'cpu':>9} {'lignes':>10} {'pic Mo':>8}   vs précédent")
+    for stage in report["stages"]:
+        peak = f"{stage['peak_rss_mb']:8.1f}" if stage["peak_rss_mb"] is not None else f"{'':>8}"
+        old = before.get(stage["stage"])
+        name = "  " * stage["depth"] + stage["stage"]
+        print(f"   {name:<18} {stage['wall']:8.3f}s {stage['cpu']:8.3f}s {stage['rows']:>10} {peak}   "
+              f"{delta(stage['wall'], old['wall'] if old else None)}")
+    print(f"   {'total':<18} {report['wall']:8.3f}s {report['cpu']:8.3f}s {'':>10} {'':>8}   "
+          f"{delta(report['wall'], previous['wall'] if previous else None)}")
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("scipy")
+
+from card_pairs import CardPairStats
+
+def test_pair_rows():
+    stats = CardPairStats(min_decks=2)
+    stats.add_deck("A1", ["Pikachu", "Poke Ball", "Misty"], 3, 1)
+    stats.add_deck("A1", ["Pikachu", "Poke Ball"], 1, 1)
+    stats.add_deck("A1", ["Misty"], 0, 2)
+    assert list(stats.rows()) == [("A1", "Pikachu", "Poke Ball", 2, 4, 2, 66)]
+
+# Extension dont aucune paire n'atteint min_decks : pas de lignes, sans erreur
+def test_no_pair_reaches_min_decks():
+    stats = CardPairStats(min_decks=3)
+    stats.add_deck("A1", ["Pikachu", "Poke Ball"], 2, 1)
+    stats.add_deck("A1", ["Pikachu", "Misty"], 1, 2)
+    stats.add_deck("A2", ["Pikachu", "Poke Ball"], 1, 0)
+    stats.add_deck("A2", ["Pikachu", "Poke Ball"], 1, 0)
+    stats.add_deck("A2", ["Pikachu", "Poke Ball"], 0, 1)
+    assert list(stats.rows()) == [("A2", "Pikachu", "Poke Ball", 3, 2, 1, 66)]